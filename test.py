@@ -1,3 +1,7 @@
+import numba
+import numpy as np
+from numba import prange
+
 # Given values
 debt_total =  615384615  # B (6 decimals)
 debt_decimals = 6
@@ -5,57 +9,270 @@ collateral_pusd = 800000000  # C (6 decimals)
 liquidation_bonus_bps = 300  # 3%
 target_cr_bps = 13000  # 1.3 (Assumed from example, since not provided in snippet 2)
 token_price_18 = 1000000000000000000  # P (1.0 in 18 decimals)
-# Normalize to 18 decimals
-B18 = debt_total * (10**(18 - debt_decimals))
-C18 = collateral_pusd * (10**(18 - 6))
-t = target_cr_bps * 1e14
-bonus = liquidation_bonus_bps * 1e14
-tokenPrice = token_price_18
-# Step-by-step logic from Solidity
-# collateralTokens = (C18 * 1e18) / tokenPrice
-collateralTokens = (C18 * 10**18) // tokenPrice
-# tB = (B18 * t) / 1e18
-tB = (B18 * int(t)) // 10**18
-# numerator = tB - collateralTokens
-numerator = tB - collateralTokens
-# denominator = t - 1e18 - bonus
-denominator = int(t) - 10**18 - int(bonus)
-# x18 = (numerator * 1e18) / denominator
-if numerator > 0 and denominator > 0:
-    x18 = (numerator * 10**18) // denominator
-    x = x18 // (10**(18 - debt_decimals))
-else:
-    x18 = 0
-    x = 0
-# rewardPUSD calculation
-# rewardPUSDRaw = (x * (10000 + bonusBps) * tokenPrice) / (10000 * 1e18)
-rewardPUSDRaw = (x * (10000 + liquidation_bonus_bps) * tokenPrice) // (10000 * 10**18)
-# rewardPUSD = (rewardPUSDRaw * 1e6) / (10 ** debtDecimals)
-rewardPUSD = (rewardPUSDRaw * 10**6) // (10**debt_decimals)
-
-# print(f"{B18=}")
-# print(f"{C18=}")
-# print(f"{t=}")
-# print(f"{bonus=}")
-# print(f"{collateralTokens=}")
-# print(f"{tB=}")
-# print(f"{numerator=}")
-# print(f"{denominator=}")
-# print(f"{x18=}")
-# print(f"{x=}")
-# print(f"{rewardPUSD=}")
-
-print("\n=== 计算结果（人类可读格式）===")
-print(f"债务总额 (B18): {B18 / 10**18:,.6f} (原始值: {B18:,})")
-print(f"抵押品总额 (C18): {C18 / 10**18:,.6f} (原始值: {C18:,})")
-print(f"目标抵押率 (t): {t / 10**14:,.6f} (原始值: {t:,.0f})")
-print(f"清算奖励 (bonus): {bonus / 10**18:,.6f} (原始值: {bonus:,.0f})")
-print(f"抵押代币数量 (collateralTokens): {collateralTokens / 10**18:,.6f} (原始值: {collateralTokens:,})")
-print(f"目标债务值 (tB): {tB / 10**18:,.6f} (原始值: {tB:,})")
-print(f"分子 (numerator): {numerator / 10**18:,.6f} (原始值: {numerator:,})")
-print(f"分母 (denominator): {denominator / 10**18:,.6f} (原始值: {denominator:,})")
-print(f"清算金额 (x18): {x18 / 10**18:,.6f} (原始值: {x18:,})")
-print(f"清算金额 (x): {x / 10**6:,.6f} (原始值: {x:,}, 精度: 10^6)")
-print(f"奖励PUSD (rewardPUSD): {rewardPUSD / 10**6:,.6f} (原始值: {rewardPUSD:,}, 精度: 10^6)")
-print("=" * 60)
 
+
+def liquidation_steps(debt_total, collateral_pusd, liquidation_bonus_bps, target_cr_bps,
+                      token_price_18, debt_decimals):
+    """按 Solidity 逻辑逐步计算，返回所有中间值（Python 大整数，与 uint256 结果一致）"""
+    # Normalize to 18 decimals
+    B18 = debt_total * (10**(18 - debt_decimals))
+    C18 = collateral_pusd * (10**(18 - 6))
+    t = target_cr_bps * 10**14
+    bonus = liquidation_bonus_bps * 10**14
+    tokenPrice = token_price_18
+    # Step-by-step logic from Solidity
+    # collateralTokens = (C18 * 1e18) / tokenPrice；价格为 1.0 时就是 C18，省掉一次大整数乘除
+    if tokenPrice == 10**18:
+        collateralTokens = C18
+    else:
+        collateralTokens = (C18 * 10**18) // tokenPrice
+    # tB = (B18 * t) / 1e18
+    tB = (B18 * t) // 10**18
+    # numerator = tB - collateralTokens
+    numerator = tB - collateralTokens
+    # denominator = t - 1e18 - bonus
+    denominator = t - 10**18 - bonus
+    # x18 = (numerator * 1e18) / denominator
+    if numerator > 0 and denominator > 0:
+        x18 = (numerator * 10**18) // denominator
+        x = x18 // (10**(18 - debt_decimals))
+    else:
+        x18 = 0
+        x = 0
+    # rewardPUSD calculation
+    # rewardPUSDRaw = (x * (10000 + bonusBps) * tokenPrice) / (10000 * 1e18)
+    rewardPUSDRaw = (x * (10000 + liquidation_bonus_bps) * tokenPrice) // (10000 * 10**18)
+    # rewardPUSD = (rewardPUSDRaw * 1e6) / (10 ** debtDecimals)
+    rewardPUSD = (rewardPUSDRaw * 10**6) // (10**debt_decimals)
+    return {
+        "B18": B18, "C18": C18, "t": t, "bonus": bonus,
+        "collateralTokens": collateralTokens, "tB": tB,
+        "numerator": numerator, "denominator": denominator,
+        "x18": x18, "x": x, "rewardPUSD": rewardPUSD,
+    }
+
+
+def compute_liquidation(debt_total, collateral_pusd, liquidation_bonus_bps, target_cr_bps,
+                        token_price_18, debt_decimals):
+    """精确计算单个场景，返回 (x, rewardPUSD)"""
+    steps = liquidation_steps(debt_total, collateral_pusd, liquidation_bonus_bps, target_cr_bps,
+                              token_price_18, debt_decimals)
+    return steps["x"], steps["rewardPUSD"]
+
+
+# Numba 版本：Solidity 中的 C18 * 1e18 等中间值远超 int64，
+# 所以这里全部换算到「债务精度」单位计算，价格使用 6 位小数（token_price_6 = token_price_18 // 1e12）。
+# 与上面的精确版本相比，x 最多相差 1 个最小单位（rewardPUSD 相应相差约 1 × 价格）；
+# 金额需在 int64 范围内，适用于 debt_decimals 较小（如 6）的场景。
+@numba.njit(
+    numba.types.UniTuple(numba.int64, 2)(
+        numba.int64, numba.int64, numba.int64, numba.int64, numba.int64, numba.int64
+    ),
+    cache=True,
+)
+def compute_liquidation_nb(debt_total, collateral_pusd, liquidation_bonus_bps, target_cr_bps,
+                           token_price_6, debt_decimals):
+    scale = np.int64(10) ** debt_decimals
+    # collateralTokens（债务精度 × 1e4）= C * scale * 1e4 / price，逐级取商和余数以避免 int64 溢出
+    cq = collateral_pusd // token_price_6
+    cr = collateral_pusd % token_price_6
+    q = cr * scale // token_price_6
+    r = cr * scale % token_price_6
+    collateral_tokens_4 = (cq * scale + q) * 10000 + r * 10000 // token_price_6
+    # numerator / denominator 同乘以 1e4 / 1e14 后的整数形式
+    numerator = debt_total * target_cr_bps - collateral_tokens_4
+    denominator = target_cr_bps - 10000 - liquidation_bonus_bps
+    if numerator <= 0 or denominator <= 0:
+        return 0, 0
+    x = numerator // denominator
+    # rewardPUSD = x * (1 + bonus) * price / 10^debtDecimals（6 位精度），同样拆开价格避免溢出
+    xb = x + x * liquidation_bonus_bps // 10000
+    pq = token_price_6 // scale
+    pr = token_price_6 % scale
+    reward = xb * pq + (xb // scale) * pr + (xb % scale) * pr // scale
+    return x, reward
+
+
+@numba.njit(parallel=True, cache=True)
+def compute_liquidation_batch(debt_totals, collaterals_pusd, liquidation_bonus_bps, target_cr_bps,
+                              token_prices_6, debt_decimals):
+    """批量计算多个场景（各参数为等长 int64 数组，debt_decimals 为所有场景共用的标量）"""
+    n = debt_totals.shape[0]
+    out_x = np.empty(n, dtype=np.int64)
+    out_reward = np.empty(n, dtype=np.int64)
+    for i in prange(n):
+        out_x[i], out_reward[i] = compute_liquidation_nb(
+            debt_totals[i], collaterals_pusd[i], liquidation_bonus_bps[i], target_cr_bps[i],
+            token_prices_6[i], debt_decimals
+        )
+    return out_x, out_reward
+
+
+def make_liquidation_batch(debt_decimals, token_price_6, liquidation_bonus_bps, target_cr_bps):
+    """为固定的市场配置生成特化的批量内核 kernel(debt_totals, collaterals_pusd) -> (x, reward)
+
+    配置参数作为闭包常量在编译期固定：换算系数、价格拆分、分母都提前算好，
+    不会用到的分支（如价格为 1.0 时的逐级取商）直接被编译器消除。结果与 compute_liquidation_nb 相同。
+    每组配置单独编译一次（闭包无法落盘缓存），适合同一配置下扫大量仓位的场景。
+    """
+    scale = 10**debt_decimals
+    denominator = target_cr_bps - 10000 - liquidation_bonus_bps
+    pq, pr = divmod(token_price_6, scale)
+    # 价格为 1.0 且 scale * 1e4 能被 1e6 整除时，collateralTokens（债务精度 × 1e4）= C * 常数
+    unit_price = token_price_6 == 10**6 and (scale * 10000) % 10**6 == 0
+    collateral_factor = scale * 10000 // 10**6 if unit_price else 0
+
+    @numba.njit(parallel=True)
+    def kernel(debt_totals, collaterals_pusd):
+        n = debt_totals.shape[0]
+        out_x = np.zeros(n, dtype=np.int64)
+        out_reward = np.zeros(n, dtype=np.int64)
+        if denominator <= 0:
+            return out_x, out_reward
+        for i in prange(n):
+            c = collaterals_pusd[i]
+            if unit_price:
+                collateral_tokens_4 = c * collateral_factor
+            else:
+                cq = c // token_price_6
+                cr = c % token_price_6
+                q = cr * scale // token_price_6
+                r = cr * scale % token_price_6
+                collateral_tokens_4 = (cq * scale + q) * 10000 + r * 10000 // token_price_6
+            numerator = debt_totals[i] * target_cr_bps - collateral_tokens_4
+            if numerator > 0:
+                x = numerator // denominator
+                xb = x + x * liquidation_bonus_bps // 10000
+                if pr == 0:
+                    reward = xb * pq
+                else:
+                    reward = xb * pq + (xb // scale) * pr + (xb % scale) * pr // scale
+                out_x[i] = x
+                out_reward[i] = reward
+        return out_x, out_reward
+
+    return kernel
+
+
+def compute_liquidation_np(debt_totals, collaterals_pusd, liquidation_bonus_bps, target_cr_bps,
+                           token_prices_6, debt_decimals):
+    """NumPy 向量化版本（int64，换算方式与 compute_liquidation_nb 相同），不依赖 Numba"""
+    B = np.asarray(debt_totals, dtype=np.int64)
+    C = np.asarray(collaterals_pusd, dtype=np.int64)
+    bonus_bps = np.asarray(liquidation_bonus_bps, dtype=np.int64)
+    cr_bps = np.asarray(target_cr_bps, dtype=np.int64)
+    price = np.asarray(token_prices_6, dtype=np.int64)
+    scale = np.int64(10) ** debt_decimals
+
+    cq, cr = np.divmod(C, price)
+    q, r = np.divmod(cr * scale, price)
+    collateral_tokens_4 = (cq * scale + q) * 10000 + r * 10000 // price
+    numerator = B * cr_bps - collateral_tokens_4
+    denominator = cr_bps - 10000 - bonus_bps
+    mask = (numerator > 0) & (denominator > 0)
+    x = np.where(mask, numerator // np.where(mask, denominator, 1), 0)
+
+    xb = x + x * bonus_bps // 10000
+    pq, pr = np.divmod(price, scale)
+    reward = xb * pq + (xb // scale) * pr + (xb % scale) * pr // scale
+    return x, reward
+
+
+def compute_liquidation_np_exact(debt_totals, collaterals_pusd, liquidation_bonus_bps, target_cr_bps,
+                                 token_prices_18, debt_decimals):
+    """NumPy 向量化版本（dtype=object，Python 大整数），结果与 compute_liquidation 完全一致，但加速有限"""
+    B18 = np.asarray(debt_totals, dtype=object) * 10**(18 - debt_decimals)
+    C18 = np.asarray(collaterals_pusd, dtype=object) * 10**(18 - 6)
+    bonus_bps = np.asarray(liquidation_bonus_bps, dtype=object)
+    t = np.asarray(target_cr_bps, dtype=object) * 10**14
+    bonus = bonus_bps * 10**14
+    token_price = np.asarray(token_prices_18, dtype=object)
+
+    collateral_tokens = (C18 * 10**18) // token_price
+    tB = (B18 * t) // 10**18
+    numerator = tB - collateral_tokens
+    denominator = t - 10**18 - bonus
+    mask = (numerator > 0) & (denominator > 0)
+    x18 = np.where(mask, (numerator * 10**18) // np.where(mask, denominator, 1), 0)
+    x = x18 // 10**(18 - debt_decimals)
+
+    reward_raw = (x * (10000 + bonus_bps) * token_price) // (10000 * 10**18)
+    reward = (reward_raw * 10**6) // 10**debt_decimals
+    return x, reward
+
+
+if __name__ == "__main__":
+    steps = liquidation_steps(debt_total, collateral_pusd, liquidation_bonus_bps, target_cr_bps,
+                              token_price_18, debt_decimals)
+    B18 = steps["B18"]
+    C18 = steps["C18"]
+    t = steps["t"]
+    bonus = steps["bonus"]
+    collateralTokens = steps["collateralTokens"]
+    tB = steps["tB"]
+    numerator = steps["numerator"]
+    denominator = steps["denominator"]
+    x18 = steps["x18"]
+    x = steps["x"]
+    rewardPUSD = steps["rewardPUSD"]
+
+    # print(f"{B18=}")
+    # print(f"{C18=}")
+    # print(f"{t=}")
+    # print(f"{bonus=}")
+    # print(f"{collateralTokens=}")
+    # print(f"{tB=}")
+    # print(f"{numerator=}")
+    # print(f"{denominator=}")
+    # print(f"{x18=}")
+    # print(f"{x=}")
+    # print(f"{rewardPUSD=}")
+
+    print("\n=== 计算结果（人类可读格式）===")
+    print(f"债务总额 (B18): {B18 / 10**18:,.6f} (原始值: {B18:,})")
+    print(f"抵押品总额 (C18): {C18 / 10**18:,.6f} (原始值: {C18:,})")
+    print(f"目标抵押率 (t): {t / 10**14:,.6f} (原始值: {t:,.0f})")
+    print(f"清算奖励 (bonus): {bonus / 10**18:,.6f} (原始值: {bonus:,.0f})")
+    print(f"抵押代币数量 (collateralTokens): {collateralTokens / 10**18:,.6f} (原始值: {collateralTokens:,})")
+    print(f"目标债务值 (tB): {tB / 10**18:,.6f} (原始值: {tB:,})")
+    print(f"分子 (numerator): {numerator / 10**18:,.6f} (原始值: {numerator:,})")
+    print(f"分母 (denominator): {denominator / 10**18:,.6f} (原始值: {denominator:,})")
+    print(f"清算金额 (x18): {x18 / 10**18:,.6f} (原始值: {x18:,})")
+    print(f"清算金额 (x): {x / 10**6:,.6f} (原始值: {x:,}, 精度: 10^6)")
+    print(f"奖励PUSD (rewardPUSD): {rewardPUSD / 10**6:,.6f} (原始值: {rewardPUSD:,}, 精度: 10^6)")
+    print("=" * 60)
+
+    # 批量场景示例：抵押品价值从 500 到 800 PUSD，其余参数不变
+    collaterals = np.arange(500_000000, 800_000001, 50_000000, dtype=np.int64)
+    n = collaterals.shape[0]
+    batch_x, batch_reward = compute_liquidation_batch(
+        np.full(n, debt_total, dtype=np.int64),
+        collaterals,
+        np.full(n, liquidation_bonus_bps, dtype=np.int64),
+        np.full(n, target_cr_bps, dtype=np.int64),
+        np.full(n, token_price_18 // 10**12, dtype=np.int64),
+        debt_decimals,
+    )
+    np_x, np_reward = compute_liquidation_np(
+        np.full(n, debt_total), collaterals, np.full(n, liquidation_bonus_bps), np.full(n, target_cr_bps),
+        np.full(n, token_price_18 // 10**12), debt_decimals,
+    )
+    exact_x, exact_reward = compute_liquidation_np_exact(
+        np.full(n, debt_total), collaterals.astype(object), np.full(n, liquidation_bonus_bps),
+        np.full(n, target_cr_bps), np.full(n, token_price_18, dtype=object), debt_decimals,
+    )
+    liquidation_kernel = make_liquidation_batch(debt_decimals, token_price_18 // 10**12,
+                                                liquidation_bonus_bps, target_cr_bps)
+    spec_x, spec_reward = liquidation_kernel(np.full(n, debt_total, dtype=np.int64), collaterals)
+    print("\n=== 批量场景（Numba）===")
+    for c, bx, br in zip(collaterals, batch_x, batch_reward):
+        ex, er = compute_liquidation(debt_total, int(c), liquidation_bonus_bps, target_cr_bps,
+                                     token_price_18, debt_decimals)
+        print(f"抵押品: {c / 10**6:,.2f}  x: {bx / 10**6:,.6f}  rewardPUSD: {br / 10**6:,.6f}"
+              f"  (精确值 x: {ex / 10**6:,.6f}  rewardPUSD: {er / 10**6:,.6f})")
+    print(f"特化内核与通用 Numba 结果一致: {bool((spec_x == batch_x).all() and (spec_reward == batch_reward).all())}")
+    print(f"NumPy(int64) 与 Numba 结果一致: {bool((np_x == batch_x).all() and (np_reward == batch_reward).all())}")
+    exact = [compute_liquidation(debt_total, int(c), liquidation_bonus_bps, target_cr_bps, token_price_18, debt_decimals)
+             for c in collaterals]
+    print(f"NumPy(object) 与逐个精确计算一致: {[(int(a), int(b)) for a, b in zip(exact_x, exact_reward)] == exact}")
+    print("=" * 60)
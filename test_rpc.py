@@ -2,13 +2,18 @@
 from web3 import Web3
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import argparse
+import asyncio
 import json
-import threading
+import select
+import socket
 import time
-from collections import Counter, defaultdict
+from collections import Counter, deque
 from concurrent.futures import ThreadPoolExecutor
 
-import requests
+import aiohttp
+import numpy as np
+import orjson
+import urllib3
 
 ip = "104.233.194.10"
 bsc_test_rpc_url = f"http://{ip}:8545"
@@ -29,55 +34,109 @@ bsc_test_rpc_url = f"http://{ip}:8545"
 
 
 
-def percentile(sorted_vals, p: float):
-    if not sorted_vals:
-        return None
-    k = int(round((p / 100.0) * (len(sorted_vals) - 1)))
-    k = max(0, min(k, len(sorted_vals) - 1))
-    return sorted_vals[k]
+def make_pool(concurrency: int) -> urllib3.PoolManager:
+    # 所有线程共享一个 urllib3 PoolManager（线程安全），省掉 requests.Session.post 每次请求的 Python 层开销
+    # block=False: 连接池空时直接新建连接，不在连接池队列上等锁；maxsize 留足余量让连接都能放回复用
+    return urllib3.PoolManager(
+        num_pools=1,
+        maxsize=concurrency * 4,
+        block=False,
+        retries=False,
+    )
 
 
-def make_session(pool_size: int):
-    s = requests.Session()
-    # 增加连接池大小以避免阻塞等待
-    # pool_connections: 每个主机的连接池数量
-    # pool_maxsize: 每个连接池的最大连接数（设置为并发数的2倍，确保不会因连接池满而阻塞）
-    adapter = requests.adapters.HTTPAdapter(
-        pool_connections=min(pool_size, 100),  # 限制连接池数量，避免过多
-        pool_maxsize=pool_size * 3,  # 每个连接池允许更多连接，减少阻塞
-        max_retries=0,
-        pool_block=True,  # 保持True，但如果连接池足够大，应该不会阻塞
+# 所有请求共用的请求头（urllib3 直接使用，不会每次合并/复制）
+_HEADERS = {
+    "Content-Type": "application/json",
+    "Connection": "keep-alive",
+}
+
+# 每个 worker 延迟缓冲区的初始容量
+LATENCY_BUF_INIT = 16384
+
+# HTTP 状态码直方图的长度（状态码直接作为下标）
+HTTP_STATUS_SLOTS = 600
+
+
+def _classify_error(cls: type) -> str:
+    # 注意：NewConnectionError 继承自 ConnectTimeoutError，需要先于超时判断
+    if issubclass(cls, urllib3.exceptions.NewConnectionError):
+        return f"request_exc_{cls.__name__}"
+    if issubclass(cls, (urllib3.exceptions.TimeoutError, asyncio.TimeoutError, TimeoutError)):
+        return "timeout"
+    if issubclass(cls, (urllib3.exceptions.HTTPError, aiohttp.ClientError, OSError)):
+        return f"request_exc_{cls.__name__}"
+    return f"exc_{cls.__name__}"
+
+
+# 异常类型 -> 错误统计键。常见类型预先生成，其余类型第一次出现时生成并缓存，
+# 出错风暴时热路径上只剩一次字典查找，不再每次格式化字符串
+_ERR_KEYS = {
+    cls: _classify_error(cls)
+    for cls in (
+        urllib3.exceptions.ReadTimeoutError,
+        urllib3.exceptions.ConnectTimeoutError,
+        urllib3.exceptions.NewConnectionError,
+        urllib3.exceptions.ProtocolError,
+        aiohttp.ClientConnectorError,
+        aiohttp.ServerDisconnectedError,
+        asyncio.TimeoutError,
+        ConnectionRefusedError,
+        ConnectionResetError,
+        BrokenPipeError,
     )
-    s.mount("http://", adapter)
-    return s
+}
+
+
+def error_key(e: BaseException) -> str:
+    cls = type(e)
+    key = _ERR_KEYS.get(cls)
+    if key is None:
+        key = _ERR_KEYS[cls] = _classify_error(cls)
+    return key
 
 
-_thread_local = threading.local()
+def skip_decode(content: bytes) -> bool:
+    """响应体是 JSON 对象且不含 "error" 时返回 True，可以不解析直接记为成功；
+    其余响应体（含 "error"、HTML 代理页、截断的内容等）需要完整解析"""
+    return content[:64].lstrip()[:1] == b"{" and b'"error"' not in content
+
+
+def describe_502(body: bytes, headers) -> str:
+    try:
+        error_msg = body[:200].decode("utf-8", errors="replace")  # 只取前200个字节
+        # 记录响应头信息，帮助判断是否有代理层
+        server_header = headers.get('Server', '未知')
+        via_header = headers.get('Via', '无')
+        x_powered_by = headers.get('X-Powered-By', '无')
+        return f"响应体: {error_msg[:150]} | Server: {server_header} | Via: {via_header} | X-Powered-By: {x_powered_by}"
+    except Exception as e:
+        return f"无法读取响应内容: {str(e)}"
 
 
-def get_thread_session(pool_size: int):
-    if not hasattr(_thread_local, "session"):
-        _thread_local.session = make_session(pool_size)
-    return _thread_local.session
+def worker(thread_id: int, pool: urllib3.PoolManager, url: str, method: str, params, timeout: float,
+           end_ts: float):
+    """每个线程在本地累积统计数据，循环结束后一次性返回，避免每个请求都抢同一把锁"""
 
+    # 预分配的纳秒延迟缓冲区 + 写入下标，满了再按 2 倍扩容
+    local_lats = np.empty(LATENCY_BUF_INIT, dtype=np.int64)
+    n_lats = 0
+    local_errs = Counter()
+    local_status = [0] * HTTP_STATUS_SLOTS  # 按状态码下标计数，无需哈希
+    local_502 = []
 
-def worker(thread_id: int, url: str, method: str, params, timeout: float, end_ts: float, pool_size: int,
-           results_list: list, lock: threading.Lock,
-           err_counters: dict, status_counter: Counter, error_details: dict):
-    sess = get_thread_session(pool_size)
-    headers = {
-        "Content-Type": "application/json",
-        "Connection": "keep-alive",
-    }
+    # 请求体只有 id 会变化：预先序列化一次，每次只拼接 id
+    tmpl_left = orjson.dumps({"jsonrpc": "2.0", "method": method, "params": params, "id": 0})[:-2]
+    tmpl_right = b"}"
 
     req_id = thread_id * 1_000_000
 
     while time.monotonic() < end_ts:
         req_id += 1
-        payload = {"jsonrpc": "2.0", "id": req_id, "method": method, "params": params}
+        body = tmpl_left + str(req_id).encode() + tmpl_right
 
         # 记录请求开始时间（在发送请求之前）
-        t0 = time.monotonic()
+        t0 = time.perf_counter_ns()
         ok = False
         err_key = None
         http_status = None
@@ -86,64 +145,247 @@ def worker(thread_id: int, url: str, method: str, params, timeout: float, end_ts
 
         try:
             # 发送请求并等待响应（这里会阻塞直到收到响应）
-            resp = sess.post(url, json=payload, headers=headers, timeout=timeout)
+            resp = pool.urlopen("POST", url, body=body, headers=_HEADERS, timeout=timeout)
             # 记录收到HTTP响应的时间（不包含JSON解析）
-            t_response = time.monotonic()
-            http_status = resp.status_code
+            t_response = time.perf_counter_ns()
+            http_status = resp.status
 
-            if resp.status_code != 200:
-                err_key = f"http_{resp.status_code}"
+            if resp.status != 200:
+                err_key = f"http_{resp.status}"
                 # 记录 502 错误的详细信息
-                if resp.status_code == 502:
-                    try:
-                        error_msg = resp.text[:200]  # 只取前200个字符
-                        # 记录响应头信息，帮助判断是否有代理层
-                        server_header = resp.headers.get('Server', '未知')
-                        via_header = resp.headers.get('Via', '无')
-                        x_powered_by = resp.headers.get('X-Powered-By', '无')
-                        error_msg = f"响应体: {error_msg[:150]} | Server: {server_header} | Via: {via_header} | X-Powered-By: {x_powered_by}"
-                    except Exception as e:
-                        error_msg = f"无法读取响应内容: {str(e)}"
+                if resp.status == 502:
+                    error_msg = describe_502(resp.data, resp.headers)
             else:
-                # 解析JSON响应（这部分时间不计入延迟，只用于验证响应）
-                data = resp.json()
-                if "error" in data:
-                    # JSON-RPC 错误
-                    code = data["error"].get("code", "unknown")
-                    err_key = f"rpc_error_{code}"
-                else:
+                # 先在原始字节上检查，只有可能是 JSON-RPC 错误或不是 JSON 对象时才完整解析（这部分时间不计入延迟）
+                content = resp.data
+                if skip_decode(content):
                     ok = True
+                else:
+                    data = orjson.loads(content)
+                    if "error" in data:
+                        # JSON-RPC 错误
+                        code = data["error"].get("code", "unknown")
+                        err_key = f"rpc_error_{code}"
+                    else:
+                        ok = True
 
-        except requests.exceptions.Timeout:
-            err_key = "timeout"
-            if t_response is None:
-                t_response = time.monotonic()  # 超时也记录时间
-        except requests.exceptions.RequestException as e:
-            err_key = f"request_exc_{type(e).__name__}"
-            if t_response is None:
-                t_response = time.monotonic()  # 异常也记录时间
         except Exception as e:
-            err_key = f"exc_{type(e).__name__}"
+            err_key = error_key(e)
             if t_response is None:
-                t_response = time.monotonic()  # 异常也记录时间
+                t_response = time.perf_counter_ns()  # 超时/异常也记录时间
 
-        # 计算延迟：只计算到收到HTTP响应的时间（毫秒）
+        # 计算延迟：只计算到收到HTTP响应的时间（纳秒整数，报告时再换算为毫秒）
         # 排除JSON解析时间，更准确地反映网络传输和服务器处理延迟
         # 对于本地服务器，这应该只需要几毫秒
-        dt = (t_response - t0) * 1000.0 if t_response is not None else (time.monotonic() - t0) * 1000.0  # ms
+        dt_ns = (t_response if t_response is not None else time.perf_counter_ns()) - t0
+
+        # 只写线程本地的数据结构，不需要加锁
+        if ok:
+            if n_lats == local_lats.size:
+                local_lats = np.resize(local_lats, n_lats * 2)
+            local_lats[n_lats] = dt_ns
+            n_lats += 1
+        else:
+            local_errs[err_key] += 1
+            # 记录 502 错误的详细信息（只记录前几个）
+            if http_status == 502 and error_msg and len(local_502) < 3:
+                local_502.append(error_msg)
+        if http_status is not None and 0 <= http_status < HTTP_STATUS_SLOTS:
+            local_status[http_status] += 1
 
-        with lock:
-            if ok:
-                results_list.append(dt)
-            else:
-                err_counters[err_key] += 1
-                # 记录 502 错误的详细信息（只记录前几个）
-                if http_status == 502 and error_msg and len(error_details.get("502_details", [])) < 3:
-                    if "502_details" not in error_details:
-                        error_details["502_details"] = []
-                    error_details["502_details"].append(error_msg)
-            if http_status is not None:
-                status_counter[http_status] += 1
+    return {"lats": local_lats[:n_lats], "errs": local_errs, "status": local_status, "err502": local_502}
+
+
+async def async_worker(worker_id: int, sess: aiohttp.ClientSession, url: str, method: str, params,
+                       timeout: float, end_ts: float):
+    """协程版本的 worker：所有协程跑在同一个事件循环（同一个 OS 线程）上，不需要锁"""
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+
+    # 预分配的纳秒延迟缓冲区 + 写入下标，满了再按 2 倍扩容
+    local_lats = np.empty(LATENCY_BUF_INIT, dtype=np.int64)
+    n_lats = 0
+    local_errs = Counter()
+    local_status = [0] * HTTP_STATUS_SLOTS  # 按状态码下标计数，无需哈希
+    local_502 = []
+
+    tmpl_left = orjson.dumps({"jsonrpc": "2.0", "method": method, "params": params, "id": 0})[:-2]
+    tmpl_right = b"}"
+
+    req_id = worker_id * 1_000_000
+
+    while time.monotonic() < end_ts:
+        req_id += 1
+        body = tmpl_left + str(req_id).encode() + tmpl_right
+
+        t0 = time.perf_counter_ns()
+        ok = False
+        err_key = None
+        http_status = None
+        error_msg = None
+        t_response = None
+
+        try:
+            async with sess.post(url, data=body, headers=_HEADERS, timeout=client_timeout) as resp:
+                content = await resp.read()
+                # 与线程版本一致：读完响应体即视为收到响应（不包含JSON解析）
+                t_response = time.perf_counter_ns()
+                http_status = resp.status
+
+                if resp.status != 200:
+                    err_key = f"http_{resp.status}"
+                    if resp.status == 502:
+                        error_msg = describe_502(content, resp.headers)
+                elif skip_decode(content):
+                    ok = True
+                else:
+                    data = orjson.loads(content)
+                    if "error" in data:
+                        code = data["error"].get("code", "unknown")
+                        err_key = f"rpc_error_{code}"
+                    else:
+                        ok = True
+
+        except Exception as e:
+            err_key = error_key(e)
+            if t_response is None:
+                t_response = time.perf_counter_ns()
+
+        dt_ns = t_response - t0
+
+        if ok:
+            if n_lats == local_lats.size:
+                local_lats = np.resize(local_lats, n_lats * 2)
+            local_lats[n_lats] = dt_ns
+            n_lats += 1
+        else:
+            local_errs[err_key] += 1
+            if http_status == 502 and error_msg and len(local_502) < 3:
+                local_502.append(error_msg)
+        if http_status is not None and 0 <= http_status < HTTP_STATUS_SLOTS:
+            local_status[http_status] += 1
+
+    return {"lats": local_lats[:n_lats], "errs": local_errs, "status": local_status, "err502": local_502}
+
+
+async def run_async(url: str, method: str, params, timeout: float, end_ts: float, concurrency: int):
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=concurrency, keepalive_timeout=60)
+    async with aiohttp.ClientSession(connector=connector) as sess:
+        return await asyncio.gather(*[
+            async_worker(i, sess, url, method, params, timeout, end_ts)
+            for i in range(concurrency)
+        ])
+
+
+def recv_response(sock: socket.socket, buf: bytearray, timeout: float):
+    """从 socket 读出一个完整的 HTTP/1.1 响应（只支持 Content-Length，不支持 chunked），返回 (status, headers, body)"""
+    while True:
+        sep = buf.find(b"\r\n\r\n")
+        if sep >= 0:
+            lines = buf[:sep].decode("latin-1").split("\r\n")
+            status = int(lines[0].split(" ", 2)[1])
+            headers = {}
+            for line in lines[1:]:
+                name, _, value = line.partition(":")
+                headers[name.strip().title()] = value.strip()
+            if "Content-Length" not in headers:
+                raise ValueError("pipeline 模式只支持带 Content-Length 的响应")
+            end = sep + 4 + int(headers["Content-Length"])
+            if len(buf) >= end:
+                body = bytes(buf[sep + 4:end])
+                del buf[:end]
+                return status, headers, body
+        # 用 select 等待可读，超时则认为连接上所有未完成的请求都超时
+        readable, _, _ = select.select([sock], [], [], timeout)
+        if not readable:
+            raise TimeoutError("等待响应超时")
+        chunk = sock.recv(65536)
+        if not chunk:
+            raise ConnectionResetError("服务器关闭了连接")
+        buf += chunk
+
+
+def pipeline_worker(thread_id: int, url: str, method: str, params, timeout: float, end_ts: float, depth: int):
+    """HTTP/1.1 pipelining：同一个 TCP 连接上先连续发出最多 depth 个请求，再按顺序读取响应"""
+    u = urllib3.util.parse_url(url)
+    addr = (u.host, u.port or 80)
+    head = (
+        f"POST {u.request_uri} HTTP/1.1\r\nHost: {u.netloc}\r\n"
+        "Content-Type: application/json\r\nConnection: keep-alive\r\nContent-Length: "
+    ).encode()
+
+    local_lats = np.empty(LATENCY_BUF_INIT, dtype=np.int64)
+    n_lats = 0
+    local_errs = Counter()
+    local_status = [0] * HTTP_STATUS_SLOTS  # 按状态码下标计数，无需哈希
+    local_502 = []
+
+    tmpl_left = orjson.dumps({"jsonrpc": "2.0", "method": method, "params": params, "id": 0})[:-2]
+    tmpl_right = b"}"
+
+    req_id = thread_id * 1_000_000
+    in_flight = deque()  # 已发送、尚未收到响应的请求的发送时间（纳秒）
+    buf = bytearray()
+    sock = None
+
+    while True:
+        err_key = None
+        try:
+            if sock is None:
+                sock = socket.create_connection(addr, timeout=timeout)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            # 填满发送窗口
+            while len(in_flight) < depth and time.monotonic() < end_ts:
+                req_id += 1
+                body = tmpl_left + str(req_id).encode() + tmpl_right
+                sock.sendall(head + str(len(body)).encode() + b"\r\n\r\n" + body)
+                in_flight.append(time.perf_counter_ns())
+            if not in_flight:
+                break
+            http_status, headers, content = recv_response(sock, buf, timeout)
+            dt_ns = time.perf_counter_ns() - in_flight.popleft()
+        except Exception as e:
+            err_key = error_key(e)
+
+        if err_key is not None:
+            # 连接已不可用：所有未完成的请求都记为失败，然后重新建立连接
+            local_errs[err_key] += max(1, len(in_flight))
+            in_flight.clear()
+            buf.clear()
+            if sock is not None:
+                sock.close()
+                sock = None
+            if time.monotonic() >= end_ts:
+                break
+            continue
+
+        if 0 <= http_status < HTTP_STATUS_SLOTS:
+            local_status[http_status] += 1
+        if http_status != 200:
+            local_errs[f"http_{http_status}"] += 1
+            if http_status == 502 and len(local_502) < 3:
+                local_502.append(describe_502(content, headers))
+            continue
+        if not skip_decode(content):
+            try:
+                data = orjson.loads(content)
+            except orjson.JSONDecodeError:
+                local_errs["exc_JSONDecodeError"] += 1
+                continue
+            if not isinstance(data, dict):
+                # 合法 JSON 但不是对象（null、数组等），与线程/asyncio 模式的 exc_TypeError 一致
+                local_errs["exc_TypeError"] += 1
+                continue
+            if "error" in data:
+                local_errs[f"rpc_error_{data['error'].get('code', 'unknown')}"] += 1
+                continue
+        if n_lats == local_lats.size:
+            local_lats = np.resize(local_lats, n_lats * 2)
+        local_lats[n_lats] = dt_ns
+        n_lats += 1
+
+    if sock is not None:
+        sock.close()
+    return {"lats": local_lats[:n_lats], "errs": local_errs, "status": local_status, "err502": local_502}
 
 
 def main():
@@ -154,6 +396,11 @@ def main():
     ap.add_argument("--timeout", type=float, default=5.0, help="请求超时时间（秒）")
     ap.add_argument("--method", default="eth_blockNumber", help="JSON-RPC 方法")
     ap.add_argument("--params", default="[]", help='JSON 数组字符串，例如："[]" 或 "[\\"latest\\", false]"')
+    ap.add_argument("--engine", choices=["thread", "asyncio", "pipeline"], default="thread",
+                    help="并发模型：thread（线程池）、asyncio（单线程事件循环 + aiohttp）"
+                         "或 pipeline（每个线程一个 TCP 连接，HTTP/1.1 pipelining，仅支持 http://）")
+    ap.add_argument("--pipeline-depth", type=int, default=8,
+                    help="pipeline 模式下每个连接同时在途的请求数")
     args = ap.parse_args()
 
     try:
@@ -162,46 +409,70 @@ def main():
             raise ValueError("params 必须是一个 JSON 数组")
     except Exception as e:
         raise SystemExit(f"无效的 --params 参数: {e}")
+    if args.engine == "pipeline" and urllib3.util.parse_url(args.url).scheme != "http":
+        raise SystemExit("pipeline 模式仅支持 http:// 地址")
+    if args.pipeline_depth < 1:
+        raise SystemExit("--pipeline-depth 必须 >= 1")
 
-    # shared stats
-    latencies_ms = []
-    lock = threading.Lock()
-    err_counters = defaultdict(int)
+    # 汇总后的统计数据（各线程结束后合并）
+    err_counters = Counter()
     status_counter = Counter()
     error_details = {}  # 用于存储错误详细信息
 
     end_ts = time.monotonic() + args.duration
-    pool_size = max(10, args.concurrency)
 
     print(f"目标地址: {args.url}")
     print(f"方法: {args.method}  参数: {params}")
-    print(f"并发数: {args.concurrency}  持续时间: {args.duration}秒  超时: {args.timeout}秒")
+    print(f"并发数: {args.concurrency}  持续时间: {args.duration}秒  超时: {args.timeout}秒  并发模型: {args.engine}")
     print("正在运行...")
 
     t_start = time.monotonic()
-    with ThreadPoolExecutor(max_workers=args.concurrency) as ex:
-        for i in range(args.concurrency):
-            ex.submit(
-                worker, i, args.url, args.method, params, args.timeout, end_ts, pool_size,
-                latencies_ms, lock, err_counters, status_counter, error_details
-            )
+    if args.engine == "asyncio":
+        results = asyncio.run(run_async(args.url, args.method, params, args.timeout, end_ts, args.concurrency))
+    elif args.engine == "pipeline":
+        with ThreadPoolExecutor(max_workers=args.concurrency) as ex:
+            futures = [
+                ex.submit(pipeline_worker, i, args.url, args.method, params, args.timeout, end_ts,
+                          args.pipeline_depth)
+                for i in range(args.concurrency)
+            ]
+            results = [f.result() for f in as_completed(futures)]
+    else:
+        pool = make_pool(max(10, args.concurrency))
+        with ThreadPoolExecutor(max_workers=args.concurrency) as ex:
+            futures = [
+                ex.submit(worker, i, pool, args.url, args.method, params, args.timeout, end_ts)
+                for i in range(args.concurrency)
+            ]
+            results = [f.result() for f in as_completed(futures)]
     t_end = time.monotonic()
     elapsed = t_end - t_start
 
+    # 每个 worker 只合并一次；延迟缓冲区直接拼接为一个数组
+    latencies_ns = np.concatenate([r["lats"] for r in results])
+    status_hist = [sum(counts) for counts in zip(*(r["status"] for r in results))]
+    status_counter.update({code: count for code, count in enumerate(status_hist) if count})
+    for r in results:
+        err_counters.update(r["errs"])
+        details = error_details.setdefault("502_details", [])
+        details.extend(r["err502"][:3 - len(details)])
+
     # summarize
-    total_ok = len(latencies_ms)
+    total_ok = len(latencies_ns)
     total_err = sum(err_counters.values())
     total = total_ok + total_err
     qps = total / elapsed if elapsed > 0 else 0.0
     ok_qps = total_ok / elapsed if elapsed > 0 else 0.0
 
-    lat_sorted = sorted(latencies_ms)
-    p50 = percentile(lat_sorted, 50)
-    p95 = percentile(lat_sorted, 95)
-    p99 = percentile(lat_sorted, 99)
-    avg = (sum(lat_sorted) / len(lat_sorted)) if lat_sorted else None
-    mn = lat_sorted[0] if lat_sorted else None
-    mx = lat_sorted[-1] if lat_sorted else None
+    # 延迟以纳秒整数存储，只在这里把最终的几个统计值换算为毫秒
+    # np.quantile(method="nearest") 基于 introselect，O(N)，不需要完整排序
+    if latencies_ns.size:
+        p50, p95, p99 = np.quantile(latencies_ns, [0.5, 0.95, 0.99], method="nearest") / 1_000_000.0
+        mn = latencies_ns.min() / 1_000_000.0
+        mx = latencies_ns.max() / 1_000_000.0
+        avg = latencies_ns.mean() / 1_000_000.0
+    else:
+        avg = None
 
     print("\n=== 测试结果 ===")
     print(f"耗时: {elapsed:.2f}秒")
@@ -6,32 +6,97 @@ RPC节点压力测试脚本
 """
 
 import argparse
+import asyncio
 import json
-import threading
 import time
-from collections import Counter, defaultdict
+from collections import Counter, defaultdict, namedtuple
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List, Dict, Optional
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+from dataclasses import dataclass, field
+from typing import List, Dict
+import aiohttp
+import numpy as np
+import orjson
+import urllib3
+
+
+# 单个请求的结果（元组，避免每个请求都分配一个字典）
+RpcResult = namedtuple(
+    "RpcResult",
+    ["success", "latency_ns", "error_type", "http_status", "rpc_error_code", "timeout"],
+)
+
+
+# 所有请求共用的请求头（不在每个请求里重建）
+_HEADERS = {
+    "Content-Type": "application/json",
+    "Connection": "keep-alive"
+}
+
+# 每个工作线程延迟缓冲区的初始容量
+LATENCY_BUF_INIT = 16384
+
+# HTTP 状态码直方图的长度（状态码直接作为下标）
+HTTP_STATUS_SLOTS = 600
+
+
+@dataclass
+class _WorkerStats:
+    """单个工作线程的本地统计数据，线程结束后再合并，热路径上无需加锁"""
+    # 预分配的纳秒延迟缓冲区 + 写入下标，满了再按 2 倍扩容
+    lats: np.ndarray = field(default_factory=lambda: np.empty(LATENCY_BUF_INIT, dtype=np.int64))
+    n_lats: int = 0
+    success: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    error_details: Counter = field(default_factory=Counter)
+    http_codes: List[int] = field(default_factory=lambda: [0] * HTTP_STATUS_SLOTS)  # 按状态码下标计数
+    rpc_errors: Counter = field(default_factory=Counter)
+    
+    def record(self, result: RpcResult):
+        """记录单个请求的结果"""
+        success, latency_ns, error_type, http_status, rpc_error_code, timeout = result
+        
+        if success:
+            self.success += 1
+            if latency_ns is not None:
+                if self.n_lats == self.lats.size:
+                    self.lats = np.resize(self.lats, self.n_lats * 2)
+                self.lats[self.n_lats] = latency_ns
+                self.n_lats += 1
+        else:
+            self.errors += 1
+            if timeout:
+                self.timeouts += 1
+            
+            # 记录错误类型
+            if error_type:
+                self.error_details[error_type] += 1
+            
+            # 记录HTTP状态码
+            if http_status and 0 <= http_status < HTTP_STATUS_SLOTS:
+                self.http_codes[http_status] += 1
+            
+            # 记录RPC错误
+            if rpc_error_code:
+                self.rpc_errors[rpc_error_code] += 1
 
 
 class RPCStressTest:
     """RPC节点压力测试类"""
     
     def __init__(self, url: str, method: str, params: list, timeout: float, 
-                 concurrency: int, duration: int):
+                 concurrency: int, duration: int, engine: str = "thread"):
         self.url = url
         self.method = method
         self.params = params
         self.timeout = timeout
         self.concurrency = concurrency
         self.duration = duration
+        self.engine = engine
         
-        # 统计数据结构
-        self.lock = threading.Lock()
-        self.success_latencies: List[float] = []  # 成功请求的延迟（毫秒）
+        # 统计数据结构（由各工作线程结束后合并）
+        self.success_latencies = np.empty(0, dtype=np.int64)  # 成功请求的延迟（纳秒，报告时换算为毫秒）
+        self._latency_chunks: List[np.ndarray] = []  # 各工作线程的延迟数组，全部结束后一次性拼接
         self.timeout_count = 0  # 超时请求数
         self.success_count = 0  # 成功请求数
         self.error_count = 0  # 总错误数
@@ -39,135 +104,169 @@ class RPCStressTest:
         self.http_status_codes: Counter = Counter()  # HTTP状态码统计
         self.rpc_errors: Counter = Counter()  # RPC错误统计
         
-        # 线程本地存储session
-        self._thread_local = threading.local()
-        
-    def _get_session(self) -> requests.Session:
-        """获取线程本地的session"""
-        if not hasattr(self._thread_local, 'session'):
-            session = requests.Session()
-            # 配置连接池
-            adapter = HTTPAdapter(
-                pool_connections=self.concurrency,
-                pool_maxsize=self.concurrency * 2,
-                max_retries=0,  # 不自动重试
-            )
-            session.mount('http://', adapter)
-            self._thread_local.session = session
-        return self._thread_local.session
-    
-    def _make_request(self, request_id: int) -> Dict:
-        """发送单个RPC请求"""
-        session = self._get_session()
-        payload = {
-            "jsonrpc": "2.0",
-            "id": request_id,
-            "method": self.method,
-            "params": self.params
-        }
-        headers = {
-            "Content-Type": "application/json",
-            "Connection": "keep-alive"
-        }
+        # 所有工作线程共享一个连接池（PoolManager 线程安全）；block=False 时连接池空了直接新建连接，
+        # 不在连接池队列上等锁
+        self._pool = urllib3.PoolManager(
+            num_pools=1,
+            maxsize=concurrency * 4,
+            block=False,
+            retries=False,  # 不自动重试
+        )
         
-        result = {
-            "success": False,
-            "latency_ms": None,
-            "error_type": None,
-            "http_status": None,
-            "rpc_error_code": None,
-            "timeout": False
-        }
+        # 请求体只有 id 会变化：method/params 在这里序列化一次，每个请求只拼接 id
+        self._params_json = orjson.dumps(self.params)
+        self._body_left = (
+            b'{"jsonrpc":"2.0","method":' + orjson.dumps(self.method)
+            + b',"params":' + self._params_json + b',"id":'
+        )
         
-        start_time = time.monotonic()
+    def _make_request(self, body: bytes) -> RpcResult:
+        """发送单个RPC请求（body为已序列化的请求体）"""
+        start_time = time.perf_counter_ns()
         
         try:
-            response = session.post(
+            response = self._pool.urlopen(
+                "POST",
                 self.url,
-                json=payload,
-                headers=headers,
+                body=body,
+                headers=_HEADERS,
                 timeout=self.timeout
             )
             
-            end_time = time.monotonic()
-            latency_ms = (end_time - start_time) * 1000.0
-            result["latency_ms"] = latency_ms
-            result["http_status"] = response.status_code
+            latency_ns = time.perf_counter_ns() - start_time
+            http_status = response.status
             
-            if response.status_code != 200:
-                result["error_type"] = f"http_{response.status_code}"
-                return result
+            if http_status != 200:
+                return RpcResult(False, latency_ns, f"http_{http_status}", http_status, None, False)
             
-            # 解析JSON响应
+            # 先在原始字节上检查：以 { 开头且不含 "error" 的响应（绝大多数成功响应）不需要完整解析JSON，
+            # 其余（RPC 错误、HTML 代理页等）完整解析，解析失败记为 json_decode_error
+            if response.data[:64].lstrip()[:1] == b"{" and b'"error"' not in response.data:
+                return RpcResult(True, latency_ns, None, http_status, None, False)
+            
+            # 可能是RPC错误，才解析JSON响应
             try:
-                data = response.json()
+                data = orjson.loads(response.data)
                 if "error" in data:
                     # RPC错误
                     error_code = data["error"].get("code", "unknown")
-                    result["error_type"] = f"rpc_error_{error_code}"
-                    result["rpc_error_code"] = error_code
-                    return result
+                    return RpcResult(False, latency_ns, f"rpc_error_{error_code}", http_status, error_code, False)
                 else:
                     # 成功
-                    result["success"] = True
-                    return result
+                    return RpcResult(True, latency_ns, None, http_status, None, False)
                     
-            except json.JSONDecodeError:
-                result["error_type"] = "json_decode_error"
-                return result
+            except orjson.JSONDecodeError:
+                return RpcResult(False, latency_ns, "json_decode_error", http_status, None, False)
                 
-        except requests.exceptions.Timeout:
-            end_time = time.monotonic()
-            latency_ms = (end_time - start_time) * 1000.0
-            result["latency_ms"] = latency_ms
-            result["error_type"] = "timeout"
-            result["timeout"] = True
-            return result
+        except (urllib3.exceptions.NewConnectionError, urllib3.exceptions.ProtocolError):
+            # 注意：NewConnectionError 继承自 ConnectTimeoutError，需要先于 TimeoutError 捕获
+            latency_ns = time.perf_counter_ns() - start_time
+            return RpcResult(False, latency_ns, "connection_error", None, None, False)
             
-        except requests.exceptions.ConnectionError:
-            end_time = time.monotonic()
-            latency_ms = (end_time - start_time) * 1000.0
-            result["latency_ms"] = latency_ms
-            result["error_type"] = "connection_error"
-            return result
+        except urllib3.exceptions.TimeoutError:
+            latency_ns = time.perf_counter_ns() - start_time
+            return RpcResult(False, latency_ns, "timeout", None, None, True)
             
         except Exception as e:
-            end_time = time.monotonic()
-            latency_ms = (end_time - start_time) * 1000.0
-            result["latency_ms"] = latency_ms
-            result["error_type"] = f"exception_{type(e).__name__}"
-            return result
+            latency_ns = time.perf_counter_ns() - start_time
+            return RpcResult(False, latency_ns, f"exception_{type(e).__name__}", None, None, False)
     
-    def _worker(self, worker_id: int, end_time: float):
-        """工作线程函数"""
+    def _worker(self, worker_id: int, end_time: float) -> _WorkerStats:
+        """工作线程函数，返回本线程的统计数据"""
         request_id_base = worker_id * 1_000_000
         request_id = request_id_base
+        stats = _WorkerStats()
         
         while time.monotonic() < end_time:
             request_id += 1
-            result = self._make_request(request_id)
+            body = self._body_left + str(request_id).encode() + b"}"
+            stats.record(self._make_request(body))
+        
+        return stats
+    
+    async def _make_request_async(self, session: aiohttp.ClientSession, body: bytes,
+                                  client_timeout: aiohttp.ClientTimeout) -> RpcResult:
+        """发送单个RPC请求（协程版本）"""
+        start_time = time.perf_counter_ns()
+        
+        try:
+            async with session.post(self.url, data=body, headers=_HEADERS, timeout=client_timeout) as response:
+                content = await response.read()
+                latency_ns = time.perf_counter_ns() - start_time
+                http_status = response.status
+            
+            if http_status != 200:
+                return RpcResult(False, latency_ns, f"http_{http_status}", http_status, None, False)
             
-            with self.lock:
-                if result["success"]:
-                    self.success_count += 1
-                    if result["latency_ms"] is not None:
-                        self.success_latencies.append(result["latency_ms"])
+            # 先在原始字节上检查：以 { 开头且不含 "error" 的响应（绝大多数成功响应）不需要完整解析JSON，
+            # 其余（RPC 错误、HTML 代理页等）完整解析，解析失败记为 json_decode_error
+            if content[:64].lstrip()[:1] == b"{" and b'"error"' not in content:
+                return RpcResult(True, latency_ns, None, http_status, None, False)
+            
+            # 可能是RPC错误，才解析JSON响应
+            try:
+                data = orjson.loads(content)
+                if "error" in data:
+                    # RPC错误
+                    error_code = data["error"].get("code", "unknown")
+                    return RpcResult(False, latency_ns, f"rpc_error_{error_code}", http_status, error_code, False)
                 else:
-                    self.error_count += 1
-                    if result["timeout"]:
-                        self.timeout_count += 1
-                    
-                    # 记录错误类型
-                    if result["error_type"]:
-                        self.error_details[result["error_type"]] += 1
-                    
-                    # 记录HTTP状态码
-                    if result["http_status"]:
-                        self.http_status_codes[result["http_status"]] += 1
+                    # 成功
+                    return RpcResult(True, latency_ns, None, http_status, None, False)
                     
-                    # 记录RPC错误
-                    if result["rpc_error_code"]:
-                        self.rpc_errors[result["rpc_error_code"]] += 1
+            except orjson.JSONDecodeError:
+                return RpcResult(False, latency_ns, "json_decode_error", http_status, None, False)
+                
+        except asyncio.TimeoutError:
+            latency_ns = time.perf_counter_ns() - start_time
+            return RpcResult(False, latency_ns, "timeout", None, None, True)
+            
+        except aiohttp.ClientConnectionError:
+            latency_ns = time.perf_counter_ns() - start_time
+            return RpcResult(False, latency_ns, "connection_error", None, None, False)
+            
+        except Exception as e:
+            latency_ns = time.perf_counter_ns() - start_time
+            return RpcResult(False, latency_ns, f"exception_{type(e).__name__}", None, None, False)
+    
+    async def _async_worker(self, worker_id: int, session: aiohttp.ClientSession, end_time: float) -> _WorkerStats:
+        """协程工作函数：所有协程运行在同一个事件循环中，无需加锁"""
+        request_id = worker_id * 1_000_000
+        stats = _WorkerStats()
+        client_timeout = aiohttp.ClientTimeout(total=self.timeout)
+        
+        while time.monotonic() < end_time:
+            request_id += 1
+            body = self._body_left + str(request_id).encode() + b"}"
+            stats.record(await self._make_request_async(session, body, client_timeout))
+        
+        return stats
+    
+    async def _run_async(self, end_time: float) -> List[_WorkerStats]:
+        """在单个事件循环中启动 concurrency 个协程"""
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency,
+            limit_per_host=self.concurrency,
+            keepalive_timeout=60,
+        )
+        async with aiohttp.ClientSession(connector=connector) as session:
+            return await asyncio.gather(*[
+                self._async_worker(i, session, end_time)
+                for i in range(self.concurrency)
+            ])
+    
+    def _merge_stats(self, stats: _WorkerStats):
+        """合并单个工作线程的统计数据"""
+        self.success_count += stats.success
+        self.error_count += stats.errors
+        self.timeout_count += stats.timeouts
+        self._latency_chunks.append(stats.lats[:stats.n_lats])
+        for error_type, count in stats.error_details.items():
+            self.error_details[error_type] += count
+        for status, count in enumerate(stats.http_codes):
+            if count:
+                self.http_status_codes[status] += count
+        self.rpc_errors.update(stats.rpc_errors)
     
     def run(self):
         """运行压力测试"""
@@ -180,38 +279,38 @@ class RPCStressTest:
         print(f"并发数: {self.concurrency}")
         print(f"持续时间: {self.duration}秒")
         print(f"请求超时: {self.timeout}秒")
+        print(f"并发模型: {self.engine}")
         print("=" * 70)
         print("测试进行中...")
         
         start_time = time.monotonic()
         end_time = start_time + self.duration
         
-        # 启动工作线程
-        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
-            futures = [
-                executor.submit(self._worker, i, end_time)
-                for i in range(self.concurrency)
-            ]
-            # 等待所有线程完成
-            for future in as_completed(futures):
-                try:
-                    future.result()
-                except Exception as e:
-                    print(f"工作线程异常: {e}")
+        if self.engine == "asyncio":
+            # 单线程事件循环 + aiohttp
+            for stats in asyncio.run(self._run_async(end_time)):
+                self._merge_stats(stats)
+        else:
+            # 启动工作线程
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                futures = [
+                    executor.submit(self._worker, i, end_time)
+                    for i in range(self.concurrency)
+                ]
+                # 等待所有线程完成，并逐个合并统计数据
+                for future in as_completed(futures):
+                    try:
+                        self._merge_stats(future.result())
+                    except Exception as e:
+                        print(f"工作线程异常: {e}")
         
         elapsed_time = time.monotonic() - start_time
+        if self._latency_chunks:
+            self.success_latencies = np.concatenate(self._latency_chunks)
         
         # 生成报告
         self._print_report(elapsed_time)
     
-    def _calculate_percentile(self, sorted_values: List[float], percentile: float) -> Optional[float]:
-        """计算百分位数"""
-        if not sorted_values:
-            return None
-        k = int(round((percentile / 100.0) * (len(sorted_values) - 1)))
-        k = max(0, min(k, len(sorted_values) - 1))
-        return sorted_values[k]
-    
     def _print_report(self, elapsed_time: float):
         """打印测试报告"""
         total_requests = self.success_count + self.error_count
@@ -237,15 +336,15 @@ class RPCStressTest:
         print(f"  成功QPS: {success_qps:.2f}")
         
         # 延迟统计
-        if self.success_latencies:
-            sorted_latencies = sorted(self.success_latencies)
-            min_latency = sorted_latencies[0]
-            max_latency = sorted_latencies[-1]
-            avg_latency = sum(sorted_latencies) / len(sorted_latencies)
-            p50 = self._calculate_percentile(sorted_latencies, 50)
-            p90 = self._calculate_percentile(sorted_latencies, 90)
-            p95 = self._calculate_percentile(sorted_latencies, 95)
-            p99 = self._calculate_percentile(sorted_latencies, 99)
+        if self.success_latencies.size:
+            # 纳秒整数数组，np.quantile 基于 introselect（O(N)），只把最终的统计值换算为毫秒
+            latencies = self.success_latencies
+            min_latency = latencies.min() / 1_000_000.0
+            max_latency = latencies.max() / 1_000_000.0
+            avg_latency = latencies.mean() / 1_000_000.0
+            p50, p90, p95, p99 = np.quantile(
+                latencies, [0.5, 0.9, 0.95, 0.99], method="nearest"
+            ) / 1_000_000.0
             
             print("\n【延迟数据统计】（仅成功请求，单位：毫秒）")
             print(f"  最小值: {min_latency:.2f}ms")
@@ -264,8 +363,8 @@ class RPCStressTest:
         print(f"  成功请求数: {self.success_count:,}")
         print(f"  成功率: {success_rate:.2f}%")
         print(f"  成功QPS: {success_qps:.2f}")
-        if self.success_latencies:
-            print(f"  平均延迟: {sum(self.success_latencies) / len(self.success_latencies):.2f}ms")
+        if self.success_latencies.size:
+            print(f"  平均延迟: {avg_latency:.2f}ms")
         
         # 超时数据统计
         print("\n【超时数据统计】")
@@ -344,6 +443,12 @@ def main():
         default=5.0,
         help="单个请求超时时间（秒，默认: 5.0）"
     )
+    parser.add_argument(
+        "--engine",
+        choices=["thread", "asyncio"],
+        default="thread",
+        help="并发模型：thread（线程池）或 asyncio（单线程事件循环 + aiohttp，默认: thread）"
+    )
     
     args = parser.parse_args()
     
@@ -367,7 +472,8 @@ def main():
             params=params,
             timeout=args.timeout,
             concurrency=args.concurrency,
-            duration=args.duration
+            duration=args.duration,
+            engine=args.engine
         )
         test.run()
         return 0
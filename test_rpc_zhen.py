@@ -4,135 +4,666 @@
 RPC节点调用脚本 - 调用 eth_getLogs 并输出延迟数据
 """
 
-import json
+import asyncio
+import sys
 import time
+import aiohttp
+import orjson
 import requests
 import argparse
-from typing import List, Optional
+from multiprocessing import Pool
+from requests.adapters import HTTPAdapter
+from dataclasses import dataclass
+from functools import lru_cache, partial
+from typing import Any, List, Optional, Tuple
 
 
-def call_eth_getLogs(url: str, address: str, params: Optional[dict] = None) -> dict:
-    """
-    调用 eth_getLogs 方法
+# 样本数达到该值时 calculate_stats 才改用 NumPy 计算
+NUMPY_STATS_MIN = 32
+
+# 所有请求共用的请求头（Content-Length 由 requests/aiohttp 按 body 长度自动填写）
+_HEADERS = {"Content-Type": "application/json"}
+
+# --keepalive-probe 使用的请求：响应只有一个区块号，只用来提前建好连接
+_PROBE_BODY = orjson.dumps({"jsonrpc": "2.0", "id": 0, "method": "eth_blockNumber", "params": []})
+
+
+class Pacer:
+    """按固定速率发送请求（开环）：wait() 只睡到下一个发送时间点；rate <= 0 时不限速"""
     
-    Args:
-        url: RPC节点地址
-        address: 合约地址
-        params: 额外的查询参数（如 fromBlock, toBlock, topics等）
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_send = None
     
-    Returns:
-        包含响应数据和延迟信息的字典
-    """
-    # 构建参数
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self.next_send is None:
+            self.next_send = now
+            return
+        # 按计划时间累加而不是从"现在"算起，某次请求慢了后续会自动追上
+        self.next_send += self.interval
+        if self.next_send > now:
+            time.sleep(self.next_send - now)
+
+
+@dataclass(slots=True)
+class RpcResult:
+    """单次 eth_getLogs 调用的结果（slots：不为每个实例创建 __dict__）"""
+    success: bool = False
+    latency_ns: int = 0  # 纳秒，输出时再换算为毫秒
+    data: Any = None  # 日志列表；只统计数量（count_only）时为 None
+    log_count: Optional[int] = None
+    error: Optional[str] = None
+    http_status: Optional[int] = None
+
+
+def make_session(pool_maxsize: int) -> requests.Session:
+    """创建复用连接的 Session（keep-alive），避免每次调用都重新建立 TCP/TLS 连接"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def build_payload(request_id: int, address: str, params: Optional[dict] = None) -> dict:
+    """构建单个 eth_getLogs 的 JSON-RPC 请求对象"""
     filter_params = {"address": address}
     if params:
         filter_params.update(params)
     
-    payload = {
+    return {
         "jsonrpc": "2.0",
-        "id": 1,
+        "id": request_id,
         "method": "eth_getLogs",
         "params": [filter_params]
     }
+
+
+def _prebuild_body(address: str, params: Optional[dict] = None) -> bytes:
+    """预先序列化单个 eth_getLogs 请求体；重复调用同一查询时只需构建一次"""
+    # 用 orjson 序列化请求体并通过 data= 发送，绕过 requests 内部 json= 路径的 complexjson.dumps
+    return orjson.dumps(build_payload(1, address, params))
+
+
+def parse_result(obj: Any, result: RpcResult) -> RpcResult:
+    """把单个 JSON-RPC 响应对象的内容填入 result（成功时为日志列表，失败时为 RPC 错误）"""
+    # 合法 JSON 但不是对象（null、字符串、数组等）时记为失败，不让 .get / in 抛出异常中断整个测试
+    if not isinstance(obj, dict):
+        result.error = f"响应格式错误: {str(obj)[:200]}"
+        return result
     
-    headers = {
-        "Content-Type": "application/json",
-        "Connection": "keep-alive"
-    }
+    if "error" in obj:
+        result.error = f"RPC错误: {obj['error']}"
+        return result
+    
+    result.success = True
+    result.data = obj.get("result", [])
+    result.log_count = len(result.data) if result.data else 0
+    return result
+
+
+def parse_content(content: bytes, result: RpcResult, count_only: bool = False) -> RpcResult:
+    """
+    解析单个请求的响应体并填入 result
+    
+    count_only 为 True 时，先只看响应体开头：是以 { 开头、含 "result" 且不含 "error" 的对象，
+    就不解码整个日志数组，直接在原始字节上统计 "transactionHash" 出现的次数作为日志数量（每条日志恰好一个；
+    bytes.count 是一次 C 层扫描，不创建任何 Python 对象），data 保持为 None
+    """
+    # JSON-RPC 的错误响应只有 jsonrpc/id/error 几个字段，"error" 必然出现在开头；
+    # 不像结果对象的响应（HTML 代理页、截断的响应体等）仍然走完整解析，报告解析错误
+    head = content[:512]
+    if count_only and head.lstrip()[:1] == b"{" and b'"result"' in head and b'"error"' not in head:
+        result.success = True
+        result.log_count = content.count(b'"transactionHash"')
+        return result
+    
+    # 解析JSON响应（orjson 直接解析原始字节，不经过 response.text 解码）
+    try:
+        return parse_result(orjson.loads(content), result)
+    
+    except orjson.JSONDecodeError as e:
+        result.error = f"JSON解析错误: {e}"
+        return result
+
+
+def call_eth_getLogs(session: requests.Session, url: str, body: bytes, count_only: bool = False) -> RpcResult:
+    """
+    调用 eth_getLogs 方法
+    
+    Args:
+        session: 复用连接的 requests.Session
+        url: RPC节点地址
+        body: _prebuild_body 预先序列化好的请求体
+        count_only: 只统计日志数量，不解码日志内容（见 parse_content）
+    
+    Returns:
+        包含响应数据和延迟信息的 RpcResult
+    """
+    result = RpcResult()
+    
+    # 计时窗口：发出请求前 ~ 收完响应体（requests 非 stream 模式下 post 返回时响应体已读完），不包含 JSON 解析
+    t0 = time.perf_counter_ns()
+    
+    try:
+        response = session.post(url, data=body, headers=_HEADERS, timeout=30)
+        
+    except requests.exceptions.Timeout:
+        result.error = "请求超时"
+        return result
+        
+    except requests.exceptions.ConnectionError as e:
+        result.error = f"连接错误: {e}"
+        return result
+        
+    except requests.RequestException as e:
+        # 其余 requests 异常（地址格式错误、重定向过多等）；非 requests 异常属于程序错误，直接抛出
+        result.error = f"异常: {type(e).__name__}: {e}"
+        return result
+    
+    finally:
+        # 成功和异常路径都在这里统一记录耗时（纳秒整数，输出时再换算为毫秒）
+        result.latency_ns = time.perf_counter_ns() - t0
+    
+    result.http_status = response.status_code
+    
+    if response.status_code != 200:
+        result.error = f"HTTP错误: {response.status_code} - {response.text[:200] if response.content else ''}"
+        return result
+    
+    return parse_content(response.content, result, count_only)
+
+
+def call_eth_getLogs_batch(session: requests.Session, url: str, payloads: List[dict]) -> dict:
+    """
+    把多个 eth_getLogs 请求打包成一个 JSON-RPC 批量请求，只发一次 HTTP 请求
+    
+    Args:
+        session: 复用连接的 requests.Session
+        url: RPC节点地址
+        payloads: build_payload 构建的请求对象列表（id 需各不相同）
     
-    result = {
+    Returns:
+        包含整体延迟 batch_latency_ns 的字典；results 为每个子请求的 RpcResult
+        （latency_ns 为整体延迟 / 子请求数）
+    """
+    body = orjson.dumps(payloads)
+    
+    batch = {
         "success": False,
-        "latency_ms": None,
-        "data": None,
+        "batch_latency_ns": None,
+        "results": [],
         "error": None,
         "http_status": None
     }
+    data = None
     
-    # 记录开始时间
-    start_time = time.monotonic()
+    # 与 call_eth_getLogs 相同的计时窗口
+    t0 = time.perf_counter_ns()
+    response = None
     
     try:
-        response = requests.post(url, json=payload, headers=headers, timeout=30)
-        
-        # 记录结束时间（收到HTTP响应的时间）
-        end_time = time.monotonic()
-        latency_ms = (end_time - start_time) * 1000.0
-        
-        result["latency_ms"] = latency_ms
-        result["http_status"] = response.status_code
+        response = session.post(url, data=body, headers=_HEADERS, timeout=30)
+    
+    except requests.exceptions.Timeout:
+        batch["error"] = "请求超时"
+    
+    except requests.exceptions.ConnectionError as e:
+        batch["error"] = f"连接错误: {e}"
+    
+    except requests.RequestException as e:
+        batch["error"] = f"异常: {type(e).__name__}: {e}"
+    
+    finally:
+        batch["batch_latency_ns"] = time.perf_counter_ns() - t0
+    
+    if response is not None:
+        batch["http_status"] = response.status_code
         
         if response.status_code != 200:
-            result["error"] = f"HTTP错误: {response.status_code}"
+            batch["error"] = f"HTTP错误: {response.status_code} - {response.text[:200]}"
+        else:
             try:
-                result["error"] += f" - {response.text[:200]}"
-            except:
-                pass
-            return result
-        
-        # 解析JSON响应
-        try:
-            data = response.json()
-            
-            if "error" in data:
-                result["error"] = f"RPC错误: {data['error']}"
-                return result
-            
-            result["success"] = True
-            result["data"] = data.get("result", [])
-            return result
-            
-        except json.JSONDecodeError as e:
-            result["error"] = f"JSON解析错误: {e}"
-            return result
-            
-    except requests.exceptions.Timeout:
-        end_time = time.monotonic()
-        latency_ms = (end_time - start_time) * 1000.0
-        result["latency_ms"] = latency_ms
-        result["error"] = "请求超时"
+                data = orjson.loads(response.content)
+                if isinstance(data, list):
+                    batch["success"] = True
+                elif isinstance(data, dict):
+                    # 节点不支持批量请求或整个批量请求被拒绝时，返回的是单个错误对象
+                    batch["error"] = f"RPC错误: {data.get('error', data)}"
+                else:
+                    batch["error"] = f"响应格式错误: {str(data)[:200]}"
+            except orjson.JSONDecodeError as e:
+                batch["error"] = f"JSON解析错误: {e}"
+    
+    # 拆分为每个子请求的结果；批量响应中的顺序不保证与请求一致，按 id 对应
+    per_call_ns = batch["batch_latency_ns"] // len(payloads)
+    by_id = {obj.get("id"): obj for obj in data if isinstance(obj, dict)} if batch["success"] else {}
+    for payload in payloads:
+        result = RpcResult(latency_ns=per_call_ns, error=batch["error"], http_status=batch["http_status"])
+        if batch["success"]:
+            obj = by_id.get(payload["id"])
+            if obj is None:
+                result.error = "批量响应中缺少该请求的结果"
+            else:
+                parse_result(obj, result)
+        batch["results"].append(result)
+    
+    return batch
+
+
+async def call_eth_getLogs_async(session: aiohttp.ClientSession, url: str, body: bytes,
+                                 count_only: bool = False) -> RpcResult:
+    """call_eth_getLogs 的 aiohttp 版本，返回结构相同"""
+    result = RpcResult()
+    
+    # 计时窗口：发出请求前 ~ 读完响应体，不包含 JSON 解析
+    t0 = time.perf_counter_ns()
+    
+    try:
+        async with session.post(url, data=body, headers=_HEADERS) as response:
+            content = await response.read()
+    
+    except asyncio.TimeoutError:
+        result.error = "请求超时"
         return result
-        
-    except requests.exceptions.ConnectionError as e:
-        end_time = time.monotonic()
-        latency_ms = (end_time - start_time) * 1000.0
-        result["latency_ms"] = latency_ms
-        result["error"] = f"连接错误: {e}"
+    
+    except aiohttp.ClientConnectionError as e:
+        result.error = f"连接错误: {e}"
+        return result
+    
+    except aiohttp.ClientError as e:
+        result.error = f"异常: {type(e).__name__}: {e}"
+        return result
+    
+    finally:
+        result.latency_ns = time.perf_counter_ns() - t0
+    
+    result.http_status = response.status
+    
+    if response.status != 200:
+        result.error = f"HTTP错误: {response.status} - {content[:200].decode('utf-8', errors='replace')}"
         return result
+    
+    return parse_content(content, result, count_only)
+
+
+async def _drive(url: str, body: bytes, count: int, concurrency: int, warmup: List[bytes],
+                 count_only: bool = False) -> Tuple[List[RpcResult], List[RpcResult]]:
+    """
+    先依次发出 warmup 中的预热请求，再并发发出 count 个请求（同时在途的请求数不超过 concurrency），
+    返回 (预热结果, 按发起顺序排列的结果)
+    """
+    connector = aiohttp.TCPConnector(limit=concurrency, force_close=False)
+    timeout = aiohttp.ClientTimeout(total=30)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        warmups = [await call_eth_getLogs_async(session, url, b) for b in warmup]
+        
+        sem = asyncio.Semaphore(concurrency)
+        
+        async def one() -> RpcResult:
+            async with sem:
+                return await call_eth_getLogs_async(session, url, body, count_only)
         
-    except Exception as e:
-        end_time = time.monotonic()
-        latency_ms = (end_time - start_time) * 1000.0
-        result["latency_ms"] = latency_ms
-        result["error"] = f"异常: {type(e).__name__}: {e}"
+        return warmups, await asyncio.gather(*(one() for _ in range(count)))
+
+
+async def call_eth_getLogs_httpx(client, url: str, body: bytes, count_only: bool = False) -> RpcResult:
+    """call_eth_getLogs 的 httpx 版本（client 为 httpx.AsyncClient），返回结构相同"""
+    import httpx  # 可选依赖，只有 --backend httpx 时才需要安装；模块已加载后只是一次字典查找
+    
+    result = RpcResult()
+    
+    # 计时窗口：发出请求前 ~ 读完响应体（非 stream 模式下 post 返回时响应体已读完），不包含 JSON 解析
+    t0 = time.perf_counter_ns()
+    
+    try:
+        response = await client.post(url, content=body, headers=_HEADERS)
+    
+    except httpx.TimeoutException:
+        result.error = "请求超时"
         return result
+    
+    except httpx.TransportError as e:
+        result.error = f"连接错误: {e}"
+        return result
+    
+    except httpx.HTTPError as e:
+        result.error = f"异常: {type(e).__name__}: {e}"
+        return result
+    
+    finally:
+        result.latency_ns = time.perf_counter_ns() - t0
+    
+    result.http_status = response.status_code
+    
+    if response.status_code != 200:
+        result.error = f"HTTP错误: {response.status_code} - {response.text[:200]}"
+        return result
+    
+    return parse_content(response.content, result, count_only)
+
+
+async def _drive_httpx(url: str, body: bytes, count: int, concurrency: int, warmup: List[bytes],
+                       count_only: bool = False) -> Tuple[List[RpcResult], List[RpcResult]]:
+    """
+    与 _drive 相同，但所有请求复用同一个 HTTP/2 连接（多路复用，多个请求同时在一条连接上传输）
+    
+    注意：HTTP/2 需要 https:// 地址（通过 TLS ALPN 协商），http:// 地址会退回 HTTP/1.1，
+    此时单连接上请求只能依次进行
+    """
+    import httpx
+    
+    limits = httpx.Limits(max_connections=1, max_keepalive_connections=1)
+    async with httpx.AsyncClient(http2=True, limits=limits, timeout=30) as client:
+        warmups = [await call_eth_getLogs_httpx(client, url, b) for b in warmup]
+        
+        sem = asyncio.Semaphore(concurrency)
+        
+        async def one() -> RpcResult:
+            async with sem:
+                return await call_eth_getLogs_httpx(client, url, body, count_only)
+        
+        return warmups, await asyncio.gather(*(one() for _ in range(count)))
+
+
+# call_eth_getLogs_pycurl 复用的 easy handle（第一次调用时创建，连接在多次调用之间保持）
+_curl = None
+
+
+def _new_curl(url: str):
+    """创建并设置一个 pycurl easy handle（--backend pycurl 的串行与 CurlMulti 模式共用）"""
+    import pycurl  # 可选依赖，只有 --backend pycurl 时才需要安装
+    
+    c = pycurl.Curl()
+    c.setopt(pycurl.URL, url)
+    c.setopt(pycurl.HTTPHEADER, [f"{k}: {v}" for k, v in _HEADERS.items()])
+    c.setopt(pycurl.TIMEOUT, 30)
+    c.setopt(pycurl.FORBID_REUSE, 0)
+    # 请求体只有一两百字节：关闭 Nagle 算法，避免小包被延迟发送；
+    # TCP Fast Open（libcurl >= 7.49）在重新建连时把请求随 SYN 一起发出，省一个 RTT
+    c.setopt(pycurl.TCP_NODELAY, 1)
+    if hasattr(pycurl, "TCP_FASTOPEN"):
+        c.setopt(pycurl.TCP_FASTOPEN, 1)
+    return c
 
 
-def calculate_stats(latencies: List[float]) -> dict:
-    """计算延迟统计信息"""
+def _finish_curl(c, errno: int, errmsg: str, content: bytes, result: RpcResult, count_only: bool) -> RpcResult:
+    """根据一次 pycurl 传输的结果填写 result；延迟使用 libcurl 自己统计的 TOTAL_TIME（微秒精度）"""
+    import pycurl
+    
+    result.latency_ns = c.getinfo(pycurl.TOTAL_TIME_T) * 1000
+    
+    if errno == pycurl.E_OPERATION_TIMEDOUT:
+        result.error = "请求超时"
+    elif errno in (pycurl.E_COULDNT_CONNECT, pycurl.E_COULDNT_RESOLVE_HOST):
+        result.error = f"连接错误: {errmsg}"
+    elif errno:
+        result.error = f"异常: pycurl.error: ({errno}) {errmsg}"
+    else:
+        result.http_status = c.getinfo(pycurl.RESPONSE_CODE)
+        if result.http_status != 200:
+            result.error = f"HTTP错误: {result.http_status} - {content[:200].decode('utf-8', errors='replace')}"
+        else:
+            parse_content(content, result, count_only)
+    return result
+
+
+def call_eth_getLogs_pycurl(url: str, body: bytes, count_only: bool = False) -> RpcResult:
+    """call_eth_getLogs 的 pycurl 版本：复用模块级的 easy handle，返回结构相同"""
+    import pycurl
+    from io import BytesIO
+    
+    global _curl
+    if _curl is None:
+        _curl = _new_curl(url)
+    
+    buf = BytesIO()
+    _curl.setopt(pycurl.URL, url)
+    _curl.setopt(pycurl.POSTFIELDS, body)
+    _curl.setopt(pycurl.WRITEDATA, buf)
+    try:
+        _curl.perform()
+    except pycurl.error as e:
+        errno, errmsg = e.args
+        return _finish_curl(_curl, errno, errmsg, b"", RpcResult(), count_only)
+    return _finish_curl(_curl, 0, "", buf.getvalue(), RpcResult(), count_only)
+
+
+def _drive_pycurl(url: str, body: bytes, count: int, concurrency: int, warmup: List[bytes],
+                  count_only: bool = False) -> Tuple[List[RpcResult], List[RpcResult]]:
+    """
+    用 pycurl.CurlMulti 在一个 select() 循环里驱动 count 个请求，同时在途的请求数不超过 concurrency，
+    不经过 asyncio 调度；预热请求与返回值同 _drive
+    """
+    import pycurl  # 可选依赖，只有 --backend pycurl 时才需要安装
+    from io import BytesIO
+    
+    multi = pycurl.CurlMulti()
+    # 每个在途请求占用一个 easy handle，完成后放回复用（连接由 multi 句柄的连接缓存复用）
+    handles = [_new_curl(url) for _ in range(max(1, min(concurrency, count)))]
+    
+    def finish(c, errno: int, errmsg: str, results: List[RpcResult]):
+        multi.remove_handle(c)
+        _finish_curl(c, errno, errmsg, c.buf.getvalue(), results[c.index], count_only)
+    
+    def run(bodies: List[bytes]) -> List[RpcResult]:
+        n = len(bodies)
+        results = [RpcResult() for _ in range(n)]
+        free = list(handles)
+        next_index = 0
+        done = 0
+        while done < n:
+            # 有空闲 handle 就发起下一个请求
+            while free and next_index < n:
+                c = free.pop()
+                c.buf = BytesIO()
+                c.setopt(pycurl.WRITEDATA, c.buf)
+                c.setopt(pycurl.POSTFIELDS, bodies[next_index])
+                c.index = next_index
+                next_index += 1
+                multi.add_handle(c)
+            
+            while True:
+                ret, _ = multi.perform()
+                if ret != pycurl.E_CALL_MULTI_PERFORM:
+                    break
+            
+            while True:
+                n_queued, ok_list, err_list = multi.info_read()
+                for c in ok_list:
+                    finish(c, 0, "", results)
+                    free.append(c)
+                for c, errno, errmsg in err_list:
+                    finish(c, errno, errmsg, results)
+                    free.append(c)
+                done += len(ok_list) + len(err_list)
+                if n_queued == 0:
+                    break
+            
+            if done < n:
+                multi.select(1.0)
+        return results
+    
+    try:
+        warmups = [run([b])[0] for b in warmup]
+        return warmups, run([body] * count)
+    finally:
+        for c in handles:
+            c.close()
+        multi.close()
+
+
+# --workers 模式下每个工作进程自己的 Session 和限速器（由 _init_worker 在进程启动时创建）
+_worker_session: Optional[requests.Session] = None
+_worker_pacer: Optional[Pacer] = None
+
+
+def _init_worker(url: str, body: bytes, rate: float):
+    """工作进程初始化：创建本进程的 Session，并发一个不计入统计的请求建好连接"""
+    global _worker_session, _worker_pacer
+    _worker_session = make_session(8)
+    _worker_pacer = Pacer(rate)
+    call_eth_getLogs(_worker_session, url, body)
+
+
+def _worker(task: Tuple[str, bytes, bool]) -> RpcResult:
+    """工作进程中执行一次调用；日志内容不传回主进程，只保留日志数量，减少进程间序列化的数据量"""
+    url, body, count_only = task
+    _worker_pacer.wait()
+    result = call_eth_getLogs(_worker_session, url, body, count_only)
+    result.data = None
+    return result
+
+
+def _run_workers(url: str, body: bytes, count: int, workers: int, rate: float,
+                 count_only: bool = False) -> List[RpcResult]:
+    """
+    把 count 次调用分给 workers 个进程执行（每个进程一个 Session），
+    响应的 JSON 解析在多个进程中并行进行，不受 GIL 限制；按发起顺序返回结果
+    """
+    # 总速率平均分给各个进程
+    worker_rate = rate / workers if rate > 0 else 0
+    chunksize = max(1, count // (workers * 4))
+    with Pool(workers, initializer=_init_worker, initargs=(url, body, worker_rate)) as pool:
+        return pool.map(_worker, [(url, body, count_only)] * count, chunksize=chunksize)
+
+
+def calculate_stats(latencies: List[int]) -> dict:
+    """计算延迟统计信息（输入为纳秒整数，返回值单位相同）"""
     if not latencies:
         return {}
     
+    if len(latencies) >= NUMPY_STATS_MIN:
+        # 样本较多时用 NumPy 在 C 层完成排序/求和；只在这里导入，少量调用时不付出导入 numpy 的开销
+        import numpy as np
+        
+        a = np.asarray(latencies, dtype=np.int64)
+        m = a.size - 1
+        # 只需要四个顺序统计量：np.partition 期望 O(n)，不必像 np.percentile 那样整体排序；
+        # 下标取法与下面纯 Python 版本相同（四舍六入五取偶，等价于 method="nearest"）
+        idx = [round(m / 2), round(90 * m / 100), round(95 * m / 100), round(99 * m / 100)]
+        p50, p90, p95, p99 = np.partition(a, idx)[idx]
+        return {
+            "count": int(a.size),
+            "min": int(a.min()),
+            "max": int(a.max()),
+            "avg": float(a.mean()),
+            "p50": int(p50),
+            "p90": int(p90),
+            "p95": int(p95),
+            "p99": int(p99)
+        }
+    
     sorted_latencies = sorted(latencies)
     n = len(sorted_latencies)
+    m = n - 1
     
-    def percentile(p: float) -> float:
-        k = int(round((p / 100.0) * (n - 1)))
-        k = max(0, min(k, n - 1))
-        return sorted_latencies[k]
-    
+    # 四个分位数的下标一次算好：p * m / 100 是整数相除，刚好落在 .5 时浮点数也是精确的，
+    # 所以 round() 的四舍六入五取偶与 NumPy 的 method="nearest" 一致；结果必然落在 [0, m]
     return {
         "count": n,
         "min": sorted_latencies[0],
         "max": sorted_latencies[-1],
         "avg": sum(sorted_latencies) / n,
-        "p50": percentile(50),
-        "p90": percentile(90),
-        "p95": percentile(95),
-        "p99": percentile(99)
+        "p50": sorted_latencies[round(m / 2)],
+        "p90": sorted_latencies[round(90 * m / 100)],
+        "p95": sorted_latencies[round(95 * m / 100)],
+        "p99": sorted_latencies[round(99 * m / 100)]
     }
 
 
-def main():
+def format_result(result: RpcResult, show_logs: bool) -> str:
+    """单次调用结果的可读文本（多行）"""
+    if result.success:
+        lines = [
+            f"  ✓ 成功",
+            f"  延迟: {result.latency_ns / 1e6:.2f}ms",
+            f"  返回日志数量: {result.log_count}",
+        ]
+        
+        if show_logs and result.data:
+            lines.append(f"\n  日志详情（前3条）:")
+            for idx, log in enumerate(result.data[:3], 1):
+                lines.append(f"    日志 {idx}:")
+                lines.append(f"      blockNumber: {log.get('blockNumber', 'N/A')}")
+                lines.append(f"      transactionHash: {log.get('transactionHash', 'N/A')}")
+                lines.append(f"      topics: {log.get('topics', [])}")
+        return "\n".join(lines) + "\n"
+    
+    latency_ns = result.latency_ns
+    return (
+        f"  ✗ 失败\n"
+        + (f"  延迟: {latency_ns / 1e6:.2f}ms\n" if latency_ns else "  延迟: N/A\n")
+        + f"  错误: {result.error}\n"
+    )
+
+
+class CallLog:
+    """
+    逐次调用的输出：text 为可读文本，jsonl 为每次调用一行 JSON，quiet 不输出
+    
+    输出先攒在内存里，每 flush_every 次调用（以及结束时）才写一次 stdout，
+    避免每次调用都执行多次 print()
+    """
+    
+    def __init__(self, mode: str, total: int, flush_every: int = 1024):
+        self.mode = mode
+        self.total = total
+        self.flush_every = flush_every
+        self.lines: List[str] = []
+        self.records = bytearray()
+        self.pending = 0
+    
+    def text(self, line: str):
+        """不属于某次调用的文本（如批量请求的标题），只在 text 模式下输出"""
+        if self.mode == "text":
+            self.lines.append(line + "\n")
+    
+    def add(self, index: int, result: RpcResult, show_logs: bool = False):
+        """记录第 index 次调用（从 1 开始）的结果"""
+        if self.mode == "jsonl":
+            self.records += orjson.dumps({
+                "i": index,
+                "latency_ms": result.latency_ns / 1e6,
+                "ok": result.success,
+                "log_count": result.log_count,
+                "error": result.error,
+            })
+            self.records += b"\n"
+        elif self.mode == "text":
+            self.lines.append(f"\n第 {index}/{self.total} 次调用...\n")
+            self.lines.append(format_result(result, show_logs))
+        
+        self.pending += 1
+        if self.pending >= self.flush_every:
+            self.flush()
+    
+    def flush(self):
+        if self.lines:
+            sys.stdout.write("".join(self.lines))
+            self.lines.clear()
+        if self.records:
+            # 先把文本层缓冲里已有的内容刷出去，保证与直接写入 buffer 的 JSON 行顺序一致
+            sys.stdout.flush()
+            sys.stdout.buffer.write(self.records)
+            self.records.clear()
+        sys.stdout.flush()
+        self.pending = 0
+
+
+def format_warmup(result: RpcResult) -> str:
+    """预热请求的一行摘要"""
+    if result.success:
+        return f"{result.latency_ns / 1e6:.2f}ms"
+    return f"{result.latency_ns / 1e6:.2f}ms（失败: {result.error}）"
+
+
+@lru_cache(maxsize=1)
+def _build_parser() -> argparse.ArgumentParser:
+    """构建命令行参数解析器；结果会被缓存，在同一进程内多次调用 main 时只构建一次"""
     parser = argparse.ArgumentParser(
         description="调用 eth_getLogs 并输出延迟数据",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -143,6 +674,15 @@ def main():
   
   # 多次调用并统计延迟
   python test_rpc_zhen.py --url http://104.233.194.10:8545 --address 0x9244212403a2e827cadca1f6fb68b43bc0c7a41f --count 10
+  
+  # 100 次调用，最多 20 个请求同时在途
+  python test_rpc_zhen.py --url http://104.233.194.10:8545 --count 100 --concurrency 20
+  
+  # 100 次调用，20 个请求在同一个 HTTP/2 连接上同时在途
+  python test_rpc_zhen.py --url https://rpc.example.com --count 100 --concurrency 20 --backend httpx
+  
+  # 100 次调用，每 10 个打包成一个 JSON-RPC 批量请求
+  python test_rpc_zhen.py --url http://104.233.194.10:8545 --count 100 --batch 10
         """
     )
     
@@ -162,94 +702,235 @@ def main():
         default=1,
         help="调用次数（默认: 1，用于统计延迟）"
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="同时在途的请求数（默认: 1，串行调用；大于 1 时使用 asyncio 并发调用）"
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["requests", "httpx", "pycurl"],
+        default="requests",
+        help="HTTP 客户端（默认: requests，--concurrency 大于 1 时使用 aiohttp；"
+             "httpx 复用单个 HTTP/2 连接，需安装 httpx[http2]；pycurl 开启 TCP_NODELAY/TCP_FASTOPEN，"
+             "并发时使用 CurlMulti，需安装 pycurl）"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="工作进程数（默认: 1；大于 1 时把调用分给多个进程，各自一个 Session，可与 --rate 一起使用）"
+    )
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=1,
+        help="每个 HTTP 请求打包的调用数（默认: 1，不打包；大于 1 时使用 JSON-RPC 批量请求）"
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=0,
+        help="每秒发送的请求数（批量模式下为每秒批量请求数；默认: 0，不限速，上一个请求结束立即发送下一个）"
+    )
+    parser.add_argument(
+        "--keepalive-probe",
+        action="store_true",
+        help="计时前先发一个 eth_blockNumber 建好连接，冷启动调用不再包含建连开销"
+    )
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="不输出每次调用的结果，只输出统计信息"
+    )
+    parser.add_argument(
+        "--jsonl",
+        action="store_true",
+        help="每次调用输出一行 JSON（i / latency_ms / ok / log_count / error），便于其他程序处理"
+    )
     parser.add_argument(
         "--params",
         default=None,
         help="额外的查询参数（JSON格式），例如: '{\"fromBlock\":\"0x0\",\"toBlock\":\"latest\"}'"
     )
     
-    args = parser.parse_args()
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    命令行入口
+    
+    Args:
+        argv: 命令行参数列表（默认: None，使用 sys.argv[1:]）；
+              从其他脚本导入时可直接传入，例如 main(["--count", "100", "--url", "..."])
+    """
+    args = _build_parser().parse_args(argv)
     
     # 解析额外参数
     extra_params = {}
     if args.params:
         try:
-            extra_params = json.loads(args.params)
-        except json.JSONDecodeError as e:
+            extra_params = orjson.loads(args.params)
+        except orjson.JSONDecodeError as e:
             print(f"错误: 无效的JSON参数格式: {e}")
             return 1
+    # requests/pycurl 后端并发数为 1 时走串行循环；其余情况（aiohttp/httpx/CurlMulti）一次并发驱动所有请求
+    concurrent = args.backend == "httpx" or args.concurrency > 1
+    if args.workers > 1 and (concurrent or args.batch > 1 or args.backend != "requests"):
+        print("错误: --workers 只能用于 requests 后端，且 --concurrency 为 1、不使用 --batch")
+        return 1
+    if args.batch > 1 and (concurrent or args.backend != "requests"):
+        print("错误: --batch 只能用于 requests 后端且 --concurrency 为 1")
+        return 1
+    if args.rate > 0 and concurrent:
+        print("错误: --rate 只能用于 requests/pycurl 后端且 --concurrency 为 1")
+        return 1
+    
+    # --jsonl 模式下 stdout 只输出每次调用的 JSON 行，标题、统计结果和预热信息改写到 stderr
+    report = partial(print, file=sys.stderr if args.jsonl else sys.stdout)
     
-    print("=" * 70)
-    print("RPC节点调用 - eth_getLogs")
-    print("=" * 70)
-    print(f"节点URL: {args.url}")
-    print(f"合约地址: {args.address}")
-    print(f"调用次数: {args.count}")
+    report("=" * 70)
+    report("RPC节点调用 - eth_getLogs")
+    report("=" * 70)
+    report(f"节点URL: {args.url}")
+    report(f"合约地址: {args.address}")
+    report(f"调用次数: {args.count}")
+    if args.backend != "requests":
+        report(f"HTTP 客户端: {args.backend}")
+    if args.concurrency > 1:
+        report(f"并发数: {args.concurrency}")
+    if args.workers > 1:
+        report(f"工作进程数: {args.workers}")
+    if args.batch > 1:
+        report(f"批量大小: {args.batch}")
+    if args.rate > 0:
+        report(f"发送速率: {args.rate}/秒")
     if extra_params:
-        print(f"额外参数: {extra_params}")
-    print("=" * 70)
+        report(f"额外参数: {extra_params}")
+    report("=" * 70)
     
+    # 每次调用的查询都相同：请求体在循环外序列化一次
+    body = _prebuild_body(args.address, extra_params)
+    # 多次调用时只需要日志数量：直接按字节统计，不解码日志内容；单次调用需要输出日志详情，仍然完整解码
+    count_only = args.count > 1
+    # 预热请求在计时循环之前依次发送，单独报告、不计入延迟统计：
+    # 可选的 eth_blockNumber 探测只负责建好连接（DNS/TCP/TLS），第一次 eth_getLogs 为冷启动调用
+    warmup = [_PROBE_BODY, body] if args.keepalive_probe else [body]
+    
+    log = CallLog("jsonl" if args.jsonl else "quiet" if args.quiet else "text", args.count)
     latencies = []
+    batch_latencies = []
     success_count = 0
     error_count = 0
     
-    for i in range(args.count):
-        print(f"\n第 {i+1}/{args.count} 次调用...")
-        
-        result = call_eth_getLogs(args.url, args.address, extra_params)
-        
-        if result["success"]:
-            success_count += 1
-            latency = result["latency_ms"]
-            latencies.append(latency)
-            log_count = len(result["data"]) if result["data"] else 0
-            
-            print(f"  ✓ 成功")
-            print(f"  延迟: {latency:.2f}ms")
-            print(f"  返回日志数量: {log_count}")
-            
-            # 如果是单次调用，显示部分日志详情
-            if args.count == 1 and result["data"]:
-                print(f"\n  日志详情（前3条）:")
-                for idx, log in enumerate(result["data"][:3], 1):
-                    print(f"    日志 {idx}:")
-                    print(f"      blockNumber: {log.get('blockNumber', 'N/A')}")
-                    print(f"      transactionHash: {log.get('transactionHash', 'N/A')}")
-                    print(f"      topics: {log.get('topics', [])}")
+    if concurrent or args.workers > 1:
+        if args.workers > 1:
+            # 冷启动调用在主进程中单独发送；各工作进程在初始化时各自预热自己的连接
+            session = make_session(8)
+            warmups = [call_eth_getLogs(session, args.url, b) for b in warmup]
+            results = _run_workers(args.url, body, args.count, args.workers, args.rate, count_only)
+        elif args.backend == "httpx":
+            warmups, results = asyncio.run(
+                _drive_httpx(args.url, body, args.count, args.concurrency, warmup, count_only))
+        elif args.backend == "pycurl":
+            warmups, results = _drive_pycurl(args.url, body, args.count, args.concurrency, warmup, count_only)
+        else:
+            warmups, results = asyncio.run(
+                _drive(args.url, body, args.count, args.concurrency, warmup, count_only))
+        for i, result in enumerate(results):
+            log.add(i + 1, result)
+            if result.success:
+                success_count += 1
+                latencies.append(result.latency_ns)
+            else:
+                error_count += 1
+    else:
+        if args.backend == "pycurl":
+            call = partial(call_eth_getLogs_pycurl, args.url)
         else:
-            error_count += 1
-            latency = result["latency_ms"] if result["latency_ms"] else 0
-            print(f"  ✗ 失败")
-            print(f"  延迟: {latency:.2f}ms" if latency else "  延迟: N/A")
-            print(f"  错误: {result['error']}")
+            session = make_session(max(args.count, 8))
+            call = partial(call_eth_getLogs, session, args.url)
+        warmups = [call(b) for b in warmup]
         
-        # 如果不是最后一次，稍作延迟
-        if i < args.count - 1:
-            time.sleep(0.1)
+        pacer = Pacer(args.rate)
+        if args.batch > 1:
+            n_batches = (args.count + args.batch - 1) // args.batch
+            for b in range(n_batches):
+                pacer.wait()
+                first = b * args.batch
+                size = min(args.batch, args.count - first)
+                log.text(f"\n第 {b+1}/{n_batches} 批调用（{size} 个请求）...")
+                
+                payloads = [build_payload(first + j + 1, args.address, extra_params) for j in range(size)]
+                batch = call_eth_getLogs_batch(session, args.url, payloads)
+                if batch["success"]:
+                    batch_latencies.append(batch["batch_latency_ns"])
+                    log.text(f"  批量延迟: {batch['batch_latency_ns'] / 1e6:.2f}ms")
+                
+                for j, result in enumerate(batch["results"]):
+                    log.add(first + j + 1, result)
+                    if result.success:
+                        success_count += 1
+                        latencies.append(result.latency_ns)
+                    else:
+                        error_count += 1
+        else:
+            for i in range(args.count):
+                pacer.wait()
+                result = call(body, count_only)
+                
+                # 如果是单次调用，显示部分日志详情
+                log.add(i + 1, result, show_logs=args.count == 1)
+                if result.success:
+                    success_count += 1
+                    latencies.append(result.latency_ns)
+                else:
+                    error_count += 1
+    
+    log.flush()
     
     # 输出统计信息
-    print("\n" + "=" * 70)
-    print("统计结果")
-    print("=" * 70)
-    print(f"总调用次数: {args.count}")
-    print(f"成功: {success_count} ({success_count/args.count*100:.2f}%)")
-    print(f"失败: {error_count} ({error_count/args.count*100:.2f}%)")
+    report("\n" + "=" * 70)
+    report("统计结果")
+    report("=" * 70)
+    report(f"总调用次数: {args.count}")
+    report(f"成功: {success_count} ({success_count/args.count*100:.2f}%)")
+    report(f"失败: {error_count} ({error_count/args.count*100:.2f}%)")
     
     if latencies:
         stats = calculate_stats(latencies)
-        print(f"\n延迟数据统计（单位：毫秒）:")
-        print(f"  调用次数: {stats['count']}")
-        print(f"  最小值: {stats['min']:.2f}ms")
-        print(f"  最大值: {stats['max']:.2f}ms")
-        print(f"  平均值: {stats['avg']:.2f}ms")
-        print(f"  P50 (中位数): {stats['p50']:.2f}ms")
-        print(f"  P90: {stats['p90']:.2f}ms")
-        print(f"  P95: {stats['p95']:.2f}ms")
-        print(f"  P99: {stats['p99']:.2f}ms")
+        report(f"\n延迟数据统计（单位：毫秒）:")
+        report(f"  调用次数: {stats['count']}")
+        report(f"  最小值: {stats['min'] / 1e6:.2f}ms")
+        report(f"  最大值: {stats['max'] / 1e6:.2f}ms")
+        report(f"  平均值: {stats['avg'] / 1e6:.2f}ms")
+        report(f"  P50 (中位数): {stats['p50'] / 1e6:.2f}ms")
+        report(f"  P90: {stats['p90'] / 1e6:.2f}ms")
+        report(f"  P95: {stats['p95'] / 1e6:.2f}ms")
+        report(f"  P99: {stats['p99'] / 1e6:.2f}ms")
+        if batch_latencies:
+            # 批量模式下上面的单次延迟为 批量延迟 / 批量大小，这里单独给出每个批量请求的整体延迟
+            batch_stats = calculate_stats(batch_latencies)
+            report(f"\n批量请求延迟统计（单位：毫秒）:")
+            report(f"  批量请求数: {batch_stats['count']}")
+            report(f"  最小值: {batch_stats['min'] / 1e6:.2f}ms")
+            report(f"  最大值: {batch_stats['max'] / 1e6:.2f}ms")
+            report(f"  平均值: {batch_stats['avg'] / 1e6:.2f}ms")
+            report(f"  P50 (中位数): {batch_stats['p50'] / 1e6:.2f}ms")
+            report(f"  P90: {batch_stats['p90'] / 1e6:.2f}ms")
+            report(f"  P95: {batch_stats['p95'] / 1e6:.2f}ms")
+            report(f"  P99: {batch_stats['p99'] / 1e6:.2f}ms")
     else:
-        print("\n无成功调用，无法统计延迟数据")
+        report("\n无成功调用，无法统计延迟数据")
+    
+    report(f"\n预热请求（不计入上面的统计）:")
+    if args.keepalive_probe:
+        report(f"  连接探测 (eth_blockNumber): {format_warmup(warmups[0])}")
+    report(f"  首次调用（冷启动）: {format_warmup(warmups[-1])}")
     
-    print("=" * 70)
+    report("=" * 70)
     
     return 0
 